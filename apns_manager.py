@@ -2,11 +2,25 @@
 from __future__ import annotations
 
 from pathlib import Path
-from typing import Optional
+from typing import List, Optional, Tuple
+import asyncio
+import json
 import logging
 import time
 import jwt
 
+from cryptography.hazmat.primitives import serialization
+from cryptography.hazmat.primitives.asymmetric import ec
+
+try:
+    import orjson
+
+    def _dumps(obj: dict) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - optional speedup
+    def _dumps(obj: dict) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
 try:
     import httpx
     APNS_AVAILABLE = True
@@ -18,11 +32,17 @@ from config import settings
 LOGGER = logging.getLogger(__name__)
 
 
+# Apple accepts a provider token for up to 1 hour; refresh well before that.
+JWT_TOKEN_TTL_SECONDS = 3000
+
+
 class APNsManager:
     """Apple Push Notification service manager."""
 
     def __init__(self) -> None:
         """Initialize APNs client."""
+        self._client: Optional["httpx.AsyncClient"] = None
+
         if not APNS_AVAILABLE:
             LOGGER.warning("httpx not installed. Push notifications disabled.")
             self.enabled = False
@@ -50,12 +70,45 @@ class APNsManager:
             self.enabled = False
             return
 
+        # Cached provider token (reused until JWT_TOKEN_TTL_SECONDS elapses)
+        self._cached_token: Optional[str] = None
+        self._token_iat: float = 0.0
+
         try:
             # Load private key
             with open(key_path, "r") as f:
                 self.private_key = f.read()
+            self._signing_key = serialization.load_pem_private_key(
+                self.private_key.encode(), password=None
+            )
+            if not isinstance(self._signing_key, ec.EllipticCurvePrivateKey):
+                raise ValueError("APNs auth key must be an EC (P-256) private key")
+
+            # JWT header is constant for the lifetime of the manager
+            self._jwt_headers = {"alg": "ES256", "kid": self.key_id}
 
             self.apns_host = "api.sandbox.push.apple.com" if self.environment == "sandbox" else "api.push.apple.com"
+
+            # Static per-manager request parts (only authorization/alert vary per send)
+            self._base_headers = {
+                "apns-topic": self.bundle_id,
+                "apns-push-type": "alert",
+                "content-type": "application/json",
+            }
+            self._aps_template = {"sound": "default"}
+
+            # Persistent HTTP/2 client shared by all sends (Apple expects long-lived connections)
+            self._client = httpx.AsyncClient(
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(
+                    max_connections=4,
+                    max_keepalive_connections=4,
+                    keepalive_expiry=3600,
+                ),
+                base_url=f"https://{self.apns_host}",
+                headers=self._base_headers,
+            )
             self.enabled = True
 
             LOGGER.debug("APNs initializing with: key_id=%s, team_id=%s, bundle_id=%s, sandbox=%s",
@@ -66,20 +119,31 @@ class APNsManager:
             self.enabled = False
 
     def _generate_jwt_token(self) -> str:
-        """Generate JWT token for APNs authentication."""
-        headers = {
-            "alg": "ES256",
-            "kid": self.key_id,
-        }
+        """Return a JWT token for APNs authentication.
+
+        The signed token is cached and reused for JWT_TOKEN_TTL_SECONDS, since
+        Apple rejects providers that re-sign on every request.
+        """
+        now = time.time()
+        if self._cached_token and now - self._token_iat < JWT_TOKEN_TTL_SECONDS:
+            return self._cached_token
 
         payload = {
             "iss": self.team_id,
-            "iat": int(time.time()),
+            "iat": int(now),
         }
 
-        token = jwt.encode(payload, self.private_key, algorithm="ES256", headers=headers)
+        # 読み込み済みの鍵オブジェクトを渡し、PEM の再パースを避ける
+        token = jwt.encode(payload, self._signing_key, algorithm="ES256", headers=self._jwt_headers)
+        self._cached_token = token
+        self._token_iat = now
         return token
 
+    def _invalidate_jwt_token(self) -> None:
+        """Drop the cached JWT token so the next send signs a fresh one."""
+        self._cached_token = None
+        self._token_iat = 0.0
+
     async def send_notification(
         self,
         device_token: str,
@@ -110,47 +174,103 @@ class APNsManager:
         try:
             # Generate JWT token
             token = self._generate_jwt_token()
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.error("Failed to send notification to %s: %s", device_token[:8], exc)
+            return False
 
-            # Construct APNs URL
-            url = f"https://{self.apns_host}/3/device/{device_token}"
+        headers = self._build_headers(token)
+        return await self._post_notification(device_token, title, body, badge, headers)
 
-            # Prepare headers
-            headers = {
-                "authorization": f"bearer {token}",
-                "apns-topic": self.bundle_id,
-                "apns-push-type": "alert",
-            }
+    async def send_many(
+        self,
+        targets: List[Tuple[str, str, str, Optional[int]]],
+        concurrency: int = 100,
+    ) -> List[bool]:
+        """
+        Send push notifications to many devices concurrently.
 
-            # Prepare payload
-            payload = {
-                "aps": {
-                    "alert": {
-                        "title": title,
-                        "body": body
-                    },
-                    "sound": "default",
-                }
-            }
+        All requests are multiplexed over the persistent HTTP/2 connection and
+        share one JWT token; a semaphore caps the number of in-flight streams.
 
+        Args:
+            targets: List of (device_token, title, body, badge) tuples
+            concurrency: Maximum number of concurrent requests
+
+        Returns:
+            List of send results in the same order as targets
+        """
+        if not self.enabled:
+            LOGGER.debug("APNs not enabled. Skipping %d notifications.", len(targets))
+            return [False] * len(targets)
+
+        try:
+            token = self._generate_jwt_token()
+        except Exception as exc:  # pylint: disable=broad-except
+            LOGGER.error("Failed to generate APNs token for batch send: %s", exc)
+            return [False] * len(targets)
+
+        headers = self._build_headers(token)
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def _send_one(device_token: str, title: str, body: str, badge: Optional[int]) -> bool:
+            if not device_token:
+                return False
+            async with semaphore:
+                return await self._post_notification(device_token, title, body, badge, headers)
+
+        results = await asyncio.gather(
+            *(_send_one(*target) for target in targets),
+            return_exceptions=True,
+        )
+        return [result is True for result in results]
+
+    def _build_headers(self, token: str) -> dict:
+        """Build per-request APNs headers (topic/push-type are client defaults)."""
+        return {"authorization": f"bearer {token}"}
+
+    async def _post_notification(
+        self,
+        device_token: str,
+        title: str,
+        body: str,
+        badge: Optional[int],
+        headers: dict,
+    ) -> bool:
+        """Post a single notification over the persistent client."""
+        try:
+            # Prepare payload from the shared aps template
+            aps = {**self._aps_template, "alert": {"title": title, "body": body}}
             if badge is not None:
-                payload["aps"]["badge"] = badge
+                aps["badge"] = badge
+            payload = {"aps": aps}
 
-            # Send notification using httpx with HTTP/2
-            async with httpx.AsyncClient(http2=True, timeout=30.0) as client:
-                response = await client.post(url, json=payload, headers=headers)
+            # Send notification over the persistent HTTP/2 connection
+            response = await self._client.post(f"/3/device/{device_token}", content=_dumps(payload), headers=headers)
 
-                if response.status_code == 200:
+            if response.status_code == 200:
+                # Guarded so the token slice is not built when INFO is filtered out
+                if LOGGER.isEnabledFor(logging.INFO):
                     LOGGER.info("📱 Notification sent to %s: %s", device_token[:8], title)
-                    return True
-                else:
+                return True
+            else:
+                if response.status_code == 403 and "ExpiredProviderToken" in response.text:
+                    self._invalidate_jwt_token()
+                if LOGGER.isEnabledFor(logging.ERROR):
                     LOGGER.error(
                         "Failed to send notification to %s: HTTP %d - %s",
                         device_token[:8],
                         response.status_code,
                         response.text
                     )
-                    return False
+                return False
 
         except Exception as exc:  # pylint: disable=broad-except
             LOGGER.error("Failed to send notification to %s: %s", device_token[:8], exc)
             return False
+
+    async def aclose(self) -> None:
+        """Close the persistent HTTP/2 client."""
+        if self._client is not None:
+            await self._client.aclose()
+            self._client = None
+        self.enabled = False
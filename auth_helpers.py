@@ -1,11 +1,20 @@
 """Authorization helpers for room-based access control."""
 from __future__ import annotations
 
+import time
+from typing import Dict, Optional, Tuple
+
 from fastapi import HTTPException
 from sqlalchemy.orm import Session
 
 from models import Room
 
+# Positive ownership results: (room_id, device_id) -> expiry (monotonic seconds).
+# Only successful checks are cached; 403/404 always hit the DB.
+OWNERSHIP_CACHE_TTL = 30.0
+OWNERSHIP_CACHE_MAXSIZE = 10_000
+_ownership_cache: Dict[Tuple[str, str], float] = {}
+
 
 async def verify_room_ownership(room_id: str, device_id: str, db: Session) -> Room:
     """Return the room if it exists and belongs to the device.
@@ -16,8 +25,59 @@ async def verify_room_ownership(room_id: str, device_id: str, db: Session) -> Ro
     """
 
     room = db.query(Room).filter_by(id=room_id).first()
-    if not room:
+    _check_owner(room.device_id if room else None, device_id)
+    _remember_ownership(room_id, device_id)
+    return room
+
+
+def verify_room_ownership_id_only(room_id: str, device_id: str, db: Session) -> None:
+    """Authorization gate that checks ownership without loading the Room row.
+
+    Only ``rooms.device_id`` is selected, which SQLite answers from the
+    ``idx_rooms_id_device`` covering index in a single probe. Successful
+    checks are cached for OWNERSHIP_CACHE_TTL seconds and skip the DB entirely.
+
+    Raises:
+        HTTPException 404: room not found
+        HTTPException 403: room owned by another device
+    """
+
+    if _ownership_cached(room_id, device_id):
+        return
+
+    row = db.query(Room.device_id).filter(Room.id == room_id).first()
+    _check_owner(row.device_id if row else None, device_id)
+    _remember_ownership(room_id, device_id)
+
+
+def invalidate_room(room_id: str) -> None:
+    """Drop cached ownership results for a room (call on delete/transfer)."""
+    for key in [key for key in _ownership_cache if key[0] == room_id]:
+        _ownership_cache.pop(key, None)
+
+
+def _check_owner(owner_device_id: Optional[str], device_id: str) -> None:
+    if owner_device_id is None:
         raise HTTPException(status_code=404, detail="Room not found")
-    if room.device_id != device_id:
+    if owner_device_id != device_id:
         raise HTTPException(status_code=403, detail="Room not owned by device")
-    return room
+
+
+def _ownership_cached(room_id: str, device_id: str) -> bool:
+    expires = _ownership_cache.get((room_id, device_id))
+    if expires is None:
+        return False
+    if expires < time.monotonic():
+        _ownership_cache.pop((room_id, device_id), None)
+        return False
+    return True
+
+
+def _remember_ownership(room_id: str, device_id: str) -> None:
+    now = time.monotonic()
+    if len(_ownership_cache) >= OWNERSHIP_CACHE_MAXSIZE:
+        for key in [key for key, expires in _ownership_cache.items() if expires < now]:
+            del _ownership_cache[key]
+        if len(_ownership_cache) >= OWNERSHIP_CACHE_MAXSIZE:
+            _ownership_cache.clear()
+    _ownership_cache[(room_id, device_id)] = now + OWNERSHIP_CACHE_TTL
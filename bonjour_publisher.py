@@ -50,16 +50,24 @@ class BonjourPublisher:
         self._service_info: Optional[ServiceInfo] = None
         self._is_registered = False
         self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._local_ip: Optional[str] = None
+        # TXTレコードの固定部分（bytesで保持し、登録ごとのエンコードを省く）
+        self._static_props = {b"version": b"1.0", b"path": b"/"}
 
     def _get_local_ip(self) -> str:
-        """ローカルIPアドレスを取得"""
+        """ローカルIPアドレスを取得（プロセス内でキャッシュ）"""
+        if self._local_ip is None:
+            self._local_ip = self._probe_local_ip()
+        return self._local_ip
+
+    @staticmethod
+    def _probe_local_ip() -> str:
+        """UDPソケットでローカルIPアドレスを調べる"""
         try:
             # UDPソケットを使用して外部への接続を試み、ローカルIPを取得
-            s = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
-            s.connect(("8.8.8.8", 80))
-            local_ip = s.getsockname()[0]
-            s.close()
-            return local_ip
+            with socket.socket(socket.AF_INET, socket.SOCK_DGRAM) as s:
+                s.connect(("8.8.8.8", 80))
+                return s.getsockname()[0]
         except Exception:
             # フォールバック: localhost
             return "127.0.0.1"
@@ -69,17 +77,13 @@ class BonjourPublisher:
         local_ip = self._get_local_ip()
 
         # TXTレコード: クライアントが追加情報を取得できる
-        properties = {
-            "version": "1.0",
-            "ssl_mode": self.ssl_mode,
-            "path": "/",
-        }
+        properties = {**self._static_props, b"ssl_mode": self.ssl_mode.encode()}
 
         # フィンガープリントがある場合は追加
         # SHA256フィンガープリントは95文字（32バイト×2 + コロン31個）
         # TXTレコードの各キー/値ペアは255バイト制限だが、fingerprintは収まる
         if self.fingerprint:
-            properties["fingerprint"] = self.fingerprint
+            properties[b"fingerprint"] = self.fingerprint.encode()
 
         # サービス名にホスト名を追加して一意にする
         service_name = f"{self.server_name} on {self.hostname}.{self.SERVICE_TYPE}"
@@ -110,6 +114,7 @@ class BonjourPublisher:
 
             await self._async_zeroconf.async_register_service(self._service_info)
             self._is_registered = True
+            self._loop = asyncio.get_running_loop()
 
             logger.info("Bonjour service registered successfully")
             return True
@@ -125,18 +130,12 @@ class BonjourPublisher:
             logger.warning("Bonjour service is already registered")
             return True
 
-        try:
-            # 既存のイベントループを取得、なければ新規作成
-            try:
-                loop = asyncio.get_running_loop()
-                # イベントループ内から呼ばれている場合は、タスクとしてスケジュール
-                asyncio.create_task(self.start_async())
-                self._loop = loop
-                return True  # 非同期で登録されるため、ここでは True を返す
-            except RuntimeError:
-                # イベントループがない場合は新規作成して実行
-                return asyncio.run(self.start_async())
+        # イベントループ内では登録完了を待てないため、非同期版の使用を求める
+        self._ensure_no_running_loop("start_async()")
 
+        try:
+            # イベントループがないので新規作成して実行
+            return asyncio.run(self.start_async())
         except Exception as e:
             logger.error(f"Failed to start Bonjour service: {e}")
             return False
@@ -161,17 +160,28 @@ class BonjourPublisher:
         if not self._is_registered:
             return
 
+        self._ensure_no_running_loop("stop_async()")
+
         try:
-            try:
-                loop = asyncio.get_running_loop()
-                # イベントループ内から呼ばれている場合
-                asyncio.create_task(self.stop_async())
-            except RuntimeError:
-                # イベントループがない場合
-                asyncio.run(self.stop_async())
+            asyncio.run(self.stop_async())
         except Exception as e:
             logger.error(f"Error stopping Bonjour service: {e}")
 
+    @staticmethod
+    def _ensure_no_running_loop(async_method: str) -> None:
+        """同期ラッパーがイベントループ内から呼ばれていないことを確認
+
+        Raises:
+            RuntimeError: 実行中のイベントループ内から呼ばれた場合
+        """
+        try:
+            asyncio.get_running_loop()
+        except RuntimeError:
+            return
+        raise RuntimeError(
+            f"Called from a running event loop; use await {async_method} instead"
+        )
+
     async def _cleanup_async(self):
         """リソースのクリーンアップ（非同期版）"""
         if self._async_zeroconf:
@@ -183,13 +193,38 @@ class BonjourPublisher:
         self._service_info = None
         self._is_registered = False
 
+    async def update_fingerprint_async(self, fingerprint: str):
+        """証明書フィンガープリントを更新（TXTレコードのみ再アナウンス）"""
+        self.fingerprint = fingerprint
+        if not self._is_registered or not self._async_zeroconf:
+            return
+
+        try:
+            self._service_info = self._build_service_info()
+            await self._async_zeroconf.async_update_service(self._service_info)
+            logger.info("Bonjour TXT record updated with new fingerprint")
+        except Exception as e:
+            logger.error(f"Failed to update Bonjour service: {e}")
+
     def update_fingerprint(self, fingerprint: str):
-        """証明書フィンガープリントを更新（サービス再登録）"""
+        """証明書フィンガープリントを更新（同期ラッパー）"""
         if not self._is_registered:
             self.fingerprint = fingerprint
             return
 
-        # 一度停止して再登録
+        self._ensure_no_running_loop("update_fingerprint_async()")
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed():
+            if loop.is_running():
+                # 別スレッドから呼ばれている場合は、登録済みループに投げて完了を待つ
+                future = asyncio.run_coroutine_threadsafe(
+                    self.update_fingerprint_async(fingerprint), loop
+                )
+                future.result()
+                return
+
+        # 最終手段: 一度停止して再登録
         self.stop()
         self.fingerprint = fingerprint
         self.start()
@@ -275,6 +310,12 @@ def stop_bonjour_service():
         _publisher = None
 
 
+async def update_bonjour_fingerprint_async(fingerprint: str):
+    """Bonjourサービスのフィンガープリントを更新（非同期版）"""
+    if _publisher:
+        await _publisher.update_fingerprint_async(fingerprint)
+
+
 def update_bonjour_fingerprint(fingerprint: str):
     """Bonjourサービスのフィンガープリントを更新"""
     if _publisher:
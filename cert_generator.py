@@ -4,16 +4,21 @@ Provides SSH-style trust model where users verify certificate fingerprint on fir
 """
 from __future__ import annotations
 
+import asyncio
+import base64
+import hashlib
 import logging
 import os
+import re
 import shutil
 from datetime import datetime, timedelta, timezone
+from ipaddress import ip_address
 from pathlib import Path
-from typing import List, Optional, Tuple
+from typing import Dict, List, Optional, Tuple
 
 from cryptography import x509
 from cryptography.hazmat.primitives import hashes, serialization
-from cryptography.hazmat.primitives.asymmetric import rsa
+from cryptography.hazmat.primitives.asymmetric import ec, ed25519, rsa
 from cryptography.x509.oid import NameOID
 
 LOGGER = logging.getLogger(__name__)
@@ -24,11 +29,40 @@ DEFAULT_CERT_PATH = DEFAULT_CERT_DIR / "server.crt"
 DEFAULT_KEY_PATH = DEFAULT_CERT_DIR / "server.key"
 BACKUP_DIR = DEFAULT_CERT_DIR / "backup"
 
+# Immutable certificate extensions shared by every generated certificate
+def _key_usage(key_encipherment: bool) -> x509.KeyUsage:
+    return x509.KeyUsage(
+        digital_signature=True,
+        key_encipherment=key_encipherment,
+        content_commitment=False,
+        data_encipherment=False,
+        key_agreement=False,
+        key_cert_sign=False,
+        crl_sign=False,
+        encipher_only=False,
+        decipher_only=False,
+    )
+
+
+_BASIC_CONSTRAINTS = x509.BasicConstraints(ca=False, path_length=None)
+_KEY_USAGE_RSA = _key_usage(key_encipherment=True)
+_KEY_USAGE_SIGNATURE_ONLY = _key_usage(key_encipherment=False)
+_EXTENDED_KEY_USAGE = x509.ExtendedKeyUsage([x509.oid.ExtendedKeyUsageOID.SERVER_AUTH])
+
+# Fingerprint cache: cert_path -> (st_mtime_ns, fingerprint)
+_fp_cache: Dict[str, Tuple[int, str]] = {}
+
+# First certificate block of a PEM file (its base64 body is the DER encoding)
+_PEM_CERT_PATTERN = re.compile(
+    rb"-----BEGIN CERTIFICATE-----(.+?)-----END CERTIFICATE-----", re.DOTALL
+)
+
 
 def generate_self_signed_cert(
     common_name: str,
     san_ips: List[str],
     valid_days: int = 3650,
+    algorithm: str = "ecdsa",
     key_size: int = 4096,
 ) -> Tuple[bytes, bytes]:
     """Generate a self-signed certificate with the given parameters.
@@ -37,16 +71,31 @@ def generate_self_signed_cert(
         common_name: Common Name for the certificate (e.g., IP address or hostname)
         san_ips: List of IP addresses for Subject Alternative Names
         valid_days: Certificate validity period in days (default: 10 years)
-        key_size: RSA key size in bits (default: 4096)
+        algorithm: Key algorithm, one of "ecdsa" (P-256), "ed25519" or "rsa"
+            (default: "ecdsa"; generation takes milliseconds instead of seconds)
+        key_size: RSA key size in bits, only used when algorithm="rsa" (default: 4096)
 
     Returns:
         Tuple of (certificate_pem, private_key_pem) as bytes
+
+    Raises:
+        ValueError: If algorithm is not supported
     """
-    # Generate RSA private key
-    private_key = rsa.generate_private_key(
-        public_exponent=65537,
-        key_size=key_size,
-    )
+    # Generate private key
+    if algorithm == "ecdsa":
+        private_key = ec.generate_private_key(ec.SECP256R1())
+        sign_hash: Optional[hashes.HashAlgorithm] = hashes.SHA256()
+    elif algorithm == "ed25519":
+        private_key = ed25519.Ed25519PrivateKey.generate()
+        sign_hash = None  # Ed25519 signs without a separate digest
+    elif algorithm == "rsa":
+        private_key = rsa.generate_private_key(
+            public_exponent=65537,
+            key_size=key_size,
+        )
+        sign_hash = hashes.SHA256()
+    else:
+        raise ValueError(f"Unsupported key algorithm: {algorithm}")
 
     # Build subject and issuer
     subject = issuer = x509.Name([
@@ -58,7 +107,6 @@ def generate_self_signed_cert(
     san_list: List[x509.GeneralName] = []
     for ip_str in san_ips:
         try:
-            from ipaddress import ip_address
             san_list.append(x509.IPAddress(ip_address(ip_str)))
         except ValueError:
             # If not a valid IP, treat as DNS name
@@ -78,28 +126,12 @@ def generate_self_signed_cert(
         .serial_number(x509.random_serial_number())
         .not_valid_before(not_valid_before)
         .not_valid_after(not_valid_after)
+        .add_extension(_BASIC_CONSTRAINTS, critical=True)
         .add_extension(
-            x509.BasicConstraints(ca=False, path_length=None),
-            critical=True,
-        )
-        .add_extension(
-            x509.KeyUsage(
-                digital_signature=True,
-                key_encipherment=True,
-                content_commitment=False,
-                data_encipherment=False,
-                key_agreement=False,
-                key_cert_sign=False,
-                crl_sign=False,
-                encipher_only=False,
-                decipher_only=False,
-            ),
+            _KEY_USAGE_RSA if algorithm == "rsa" else _KEY_USAGE_SIGNATURE_ONLY,
             critical=True,
         )
-        .add_extension(
-            x509.ExtendedKeyUsage([x509.oid.ExtendedKeyUsageOID.SERVER_AUTH]),
-            critical=False,
-        )
+        .add_extension(_EXTENDED_KEY_USAGE, critical=False)
     )
 
     if san_list:
@@ -109,36 +141,76 @@ def generate_self_signed_cert(
         )
 
     # Sign the certificate
-    certificate = builder.sign(private_key, hashes.SHA256())
+    certificate = builder.sign(private_key, sign_hash)
 
     # Serialize to PEM format
     cert_pem = certificate.public_bytes(serialization.Encoding.PEM)
     key_pem = private_key.private_bytes(
         encoding=serialization.Encoding.PEM,
-        format=serialization.PrivateFormat.TraditionalOpenSSL,
+        format=serialization.PrivateFormat.PKCS8,
         encryption_algorithm=serialization.NoEncryption(),
     )
 
     return cert_pem, key_pem
 
 
-def get_certificate_fingerprint(cert_path: str) -> str:
+def _load_cert(cert_path: str) -> x509.Certificate:
+    """Read and parse a PEM certificate file."""
+    with open(cert_path, "rb") as f:
+        cert_data = f.read()
+    return x509.load_pem_x509_certificate(cert_data)
+
+
+def get_certificate_fingerprint(cert_path: str, cert: Optional[x509.Certificate] = None) -> str:
     """Calculate SHA256 fingerprint of a certificate file.
 
     Args:
         cert_path: Path to the certificate file (PEM format)
+        cert: Already-parsed certificate for cert_path (skips re-reading the file)
 
     Returns:
         Fingerprint in colon-separated format (e.g., "SHA256:A1:B2:C3:...")
+
+    Note: Results are cached per path and invalidated when the file's mtime changes.
     """
-    with open(cert_path, "rb") as f:
-        cert_data = f.read()
+    mtime_ns = os.stat(cert_path).st_mtime_ns
+    hit = _fp_cache.get(cert_path)
+    if hit and hit[0] == mtime_ns:
+        return hit[1]
+
+    if cert is not None:
+        der = cert.public_bytes(serialization.Encoding.DER)
+    else:
+        with open(cert_path, "rb") as f:
+            der = _pem_to_der(f.read())
+    result = _format_fingerprint(der)
+    _fp_cache[cert_path] = (mtime_ns, result)
+    return result
+
+
+def _pem_to_der(pem_data: bytes) -> bytes:
+    """Extract the DER bytes of the first certificate in PEM data.
+
+    Avoids a full X.509 parse when only the fingerprint is needed.
+    """
+    match = _PEM_CERT_PATTERN.search(pem_data)
+    if not match:
+        # Not a plain PEM block; let cryptography parse it (and raise if invalid)
+        cert = x509.load_pem_x509_certificate(pem_data)
+        return cert.public_bytes(serialization.Encoding.DER)
+    return base64.b64decode(match.group(1))
+
+
+def _format_fingerprint(der: bytes) -> str:
+    """Format the SHA256 digest of DER bytes as "SHA256:A1:B2:..."."""
+    return f"SHA256:{hashlib.sha256(der).digest().hex(':').upper()}"
 
-    cert = x509.load_pem_x509_certificate(cert_data)
-    fingerprint = cert.fingerprint(hashes.SHA256())
-    hex_str = fingerprint.hex().upper()
-    formatted = ":".join(hex_str[i:i+2] for i in range(0, len(hex_str), 2))
-    return f"SHA256:{formatted}"
+
+def _cache_fingerprint(cert_path: Path, cert_pem: bytes) -> str:
+    """Compute the fingerprint of freshly written PEM bytes and prime the cache."""
+    fingerprint = _format_fingerprint(_pem_to_der(cert_pem))
+    _fp_cache[str(cert_path)] = (os.stat(cert_path).st_mtime_ns, fingerprint)
+    return fingerprint
 
 
 def get_certificate_info(cert_path: str) -> dict:
@@ -150,11 +222,8 @@ def get_certificate_info(cert_path: str) -> dict:
     Returns:
         Dictionary with certificate information
     """
-    with open(cert_path, "rb") as f:
-        cert_data = f.read()
-
-    cert = x509.load_pem_x509_certificate(cert_data)
-    fingerprint = get_certificate_fingerprint(cert_path)
+    cert = _load_cert(cert_path)
+    fingerprint = get_certificate_fingerprint(cert_path, cert=cert)
 
     # Extract Common Name
     common_name = ""
@@ -222,18 +291,11 @@ def ensure_certificate_exists(
         san_ips=san_ips,
     )
 
-    # Write files
-    with open(cert_path, "wb") as f:
-        f.write(cert_pem)
-    with open(key_path, "wb") as f:
-        f.write(key_pem)
-
-    # Set permissions
-    os.chmod(key_path, 0o600)
-    os.chmod(cert_path, 0o644)
+    # Write files (key first, permissions set at creation)
+    _write_cert_pair(cert_path, cert_pem, key_path, key_pem)
     os.chmod(cert_dir, 0o700)
 
-    fingerprint = get_certificate_fingerprint(str(cert_path))
+    fingerprint = _cache_fingerprint(cert_path, cert_pem)
     LOGGER.info("Certificate generated: %s", fingerprint)
 
     return str(cert_path), str(key_path), fingerprint
@@ -285,15 +347,9 @@ def regenerate_certificate(
         san_ips=san_ips,
     )
 
-    with open(cert_path, "wb") as f:
-        f.write(cert_pem)
-    with open(key_path, "wb") as f:
-        f.write(key_pem)
-
-    os.chmod(key_path, 0o600)
-    os.chmod(cert_path, 0o644)
+    _write_cert_pair(cert_path, cert_pem, key_path, key_pem)
 
-    new_fingerprint = get_certificate_fingerprint(str(cert_path))
+    new_fingerprint = _cache_fingerprint(cert_path, cert_pem)
 
     LOGGER.info(
         "Certificate regenerated: old=%s, new=%s",
@@ -304,6 +360,32 @@ def regenerate_certificate(
     return str(cert_path), str(key_path), old_fingerprint, new_fingerprint
 
 
+async def ensure_certificate_exists_async(
+    cert_dir: Optional[Path] = None,
+    hostname: str = "localhost",
+    san_ips: Optional[List[str]] = None,
+) -> Tuple[str, str, str]:
+    """Async variant of ensure_certificate_exists.
+
+    Key generation and file I/O run in a worker thread so the event loop
+    is not blocked.
+    """
+    return await asyncio.to_thread(ensure_certificate_exists, cert_dir, hostname, san_ips)
+
+
+async def regenerate_certificate_async(
+    cert_dir: Optional[Path] = None,
+    hostname: str = "localhost",
+    san_ips: Optional[List[str]] = None,
+) -> Tuple[str, str, str, str]:
+    """Async variant of regenerate_certificate.
+
+    Key generation and file I/O run in a worker thread so the event loop
+    is not blocked.
+    """
+    return await asyncio.to_thread(regenerate_certificate, cert_dir, hostname, san_ips)
+
+
 def revoke_certificate(cert_dir: Optional[Path] = None) -> bool:
     """Revoke (delete) the current certificate.
 
@@ -321,6 +403,7 @@ def revoke_certificate(cert_dir: Optional[Path] = None) -> bool:
     if cert_path.exists():
         fingerprint = get_certificate_fingerprint(str(cert_path))
         cert_path.unlink()
+        _fp_cache.pop(str(cert_path), None)
         LOGGER.warning("[REVOKED] Certificate deleted: %s", fingerprint)
         deleted = True
 
@@ -331,6 +414,31 @@ def revoke_certificate(cert_dir: Optional[Path] = None) -> bool:
     return deleted
 
 
+def _write_cert_pair(cert_path: Path, cert_pem: bytes, key_path: Path, key_pem: bytes) -> None:
+    """Atomically write the private key (0600) and then the certificate (0644)."""
+    _write_atomic(key_path, key_pem, 0o600)
+    _write_atomic(cert_path, cert_pem, 0o644)
+
+
+def _write_atomic(path: Path, data: bytes, mode: int) -> None:
+    """Write data to a temp file created with mode, fsync it, then rename over path.
+
+    A crash mid-write leaves the previous file intact instead of a partial PEM.
+    """
+    tmp_path = path.with_name(path.name + ".tmp")
+    fd = os.open(tmp_path, os.O_WRONLY | os.O_CREAT | os.O_TRUNC, mode)
+    try:
+        os.fchmod(fd, mode)  # creation mode is filtered by umask
+        view = memoryview(data)
+        while view:
+            written = os.write(fd, view)
+            view = view[written:]
+        os.fsync(fd)
+    finally:
+        os.close(fd)
+    os.replace(tmp_path, path)
+
+
 def _cleanup_old_backups(backup_dir: Path, keep: int = 5) -> None:
     """Remove old backup files, keeping only the most recent ones.
 
@@ -2,9 +2,10 @@
 from __future__ import annotations
 
 import logging
-from logging.handlers import RotatingFileHandler
-from pathlib import Path
-from typing import List, Literal, Optional, Tuple
+import os
+from functools import lru_cache
+from logging.handlers import MemoryHandler, RotatingFileHandler
+from typing import List, Literal, Tuple
 
 from pydantic import field_validator
 from pydantic_settings import BaseSettings, SettingsConfigDict
@@ -19,6 +20,9 @@ class Settings(BaseSettings):
         "http://127.0.0.1:35000",
     ]
     threads_compat_mode: bool = True  # thread_id省略を許可する互換モード（Phase A/Bで使用）
+    max_concurrent_jobs: int = 4  # 同時実行するジョブ数の上限（超過分はqueuedのまま待機）
+    job_output_dir: str = "./data/job_outputs"  # 大きな stdout の保存先
+    job_stdout_inline_limit: int = 64_000  # これを超える stdout はファイルに逃がす（文字数）
 
     # APNs Push Notification Configuration
     apns_key_id: str = ""
@@ -72,55 +76,49 @@ class Settings(BaseSettings):
         return [ip.strip() for ip in self.server_san_ips.split(",") if ip.strip()]
 
 
-settings = Settings()
+@lru_cache(maxsize=1)
+def get_settings() -> Settings:
+    """Return the process-wide Settings, reading .env on first use."""
+    return Settings()
 
-# SSL certificate state tracking (set once at startup, never reset)
-_certificate_fallback_warning: bool = False
-_ssl_paths_initialized: bool = False
-_cached_ssl_paths: Optional[Tuple[str, str, str]] = None
 
+def __getattr__(name: str):
+    # `from config import settings` stays valid but no longer parses the
+    # environment at import time (PEP 562 module attribute).
+    if name == "settings":
+        return get_settings()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
 
-def get_ssl_paths() -> Tuple[str, str, str]:
-    """Get SSL certificate paths based on configuration.
+
+@lru_cache(maxsize=None)
+def _compute_ssl_paths() -> Tuple[str, str, str, bool]:
+    """Resolve SSL certificate paths once per process.
 
     Returns:
-        Tuple of (cert_path, key_path, mode_used)
+        Tuple of (cert_path, key_path, mode_used, fallback_warning)
 
     Raises:
         RuntimeError: If commercial certificate not found and fallback disabled
-
-    Note: The fallback warning state is set only on the first call and never reset.
-    This ensures /health consistently reports the fallback status.
+            (not cached, so a later call re-checks)
     """
-    global _certificate_fallback_warning, _ssl_paths_initialized, _cached_ssl_paths
-
-    # Return cached result if already initialized (prevents resetting fallback warning)
-    if _ssl_paths_initialized and _cached_ssl_paths is not None:
-        return _cached_ssl_paths
-
+    settings = get_settings()
     mode = settings.ssl_mode.lower()
     logger = logging.getLogger(__name__)
 
     if mode == "commercial":
         logger.info("[SSL] Mode: commercial (forced)")
-        _cached_ssl_paths = (settings.commercial_cert_path, settings.commercial_key_path, "commercial")
-        _ssl_paths_initialized = True
-        return _cached_ssl_paths
+        return settings.commercial_cert_path, settings.commercial_key_path, "commercial", False
 
     if mode == "self_signed":
         logger.info("[SSL] Mode: self_signed (forced)")
-        _cached_ssl_paths = (settings.ssl_cert_path, settings.ssl_key_path, "self_signed")
-        _ssl_paths_initialized = True
-        return _cached_ssl_paths
+        return settings.ssl_cert_path, settings.ssl_key_path, "self_signed", False
 
     # auto mode
-    commercial_exists = Path(settings.commercial_cert_path).exists()
+    commercial_exists = os.path.exists(settings.commercial_cert_path)
 
     if commercial_exists:
         logger.info("[SSL] Mode: auto -> using commercial certificate")
-        _cached_ssl_paths = (settings.commercial_cert_path, settings.commercial_key_path, "commercial")
-        _ssl_paths_initialized = True
-        return _cached_ssl_paths
+        return settings.commercial_cert_path, settings.commercial_key_path, "commercial", False
 
     # Commercial not found - check if fallback is enabled
     if not settings.ssl_auto_fallback_enabled:
@@ -137,15 +135,60 @@ def get_ssl_paths() -> Tuple[str, str, str]:
         "[SSL] SECURITY: Falling back to self-signed certificate. "
         "Existing clients may need to re-verify."
     )
-    _certificate_fallback_warning = True
-    _cached_ssl_paths = (settings.ssl_cert_path, settings.ssl_key_path, "self_signed")
-    _ssl_paths_initialized = True
-    return _cached_ssl_paths
+    return settings.ssl_cert_path, settings.ssl_key_path, "self_signed", True
+
+
+def get_ssl_paths() -> Tuple[str, str, str]:
+    """Get SSL certificate paths based on configuration.
+
+    Returns:
+        Tuple of (cert_path, key_path, mode_used)
+
+    Raises:
+        RuntimeError: If commercial certificate not found and fallback disabled
+
+    Note: The result (including the fallback warning state) is computed on the
+    first successful call and cached for the process lifetime. This ensures
+    /health consistently reports the fallback status.
+    """
+    return _compute_ssl_paths()[:3]
 
 
 def is_certificate_fallback_warning() -> bool:
     """Check if certificate fallback warning is active."""
-    return _certificate_fallback_warning
+    if _compute_ssl_paths.cache_info().currsize == 0:
+        return False
+    return _compute_ssl_paths()[3]
+
+
+class FastRotatingFileHandler(RotatingFileHandler):
+    """RotatingFileHandler that tracks the file size itself.
+
+    The stock shouldRollover stats/seeks the log file on every record; here
+    the size is read once at open and then counted as records are written.
+    Records are counted in encoded bytes (logs contain Japanese and emoji),
+    so the file rotates at maxBytes like the stock handler.
+    """
+
+    def __init__(self, *args, **kwargs) -> None:
+        super().__init__(*args, **kwargs)
+        try:
+            self._bytes_written = os.path.getsize(self.baseFilename)
+        except OSError:
+            self._bytes_written = 0
+
+    def shouldRollover(self, record: logging.LogRecord) -> bool:
+        if self.maxBytes <= 0:
+            return False
+        # 文字数ではなく実際に書き込まれるバイト数で数える
+        msg = self.format(record) + self.terminator
+        size = len(msg.encode(self.encoding or "utf-8", errors="replace"))
+        if self._bytes_written + size >= self.maxBytes:
+            # doRollover() follows, and this record starts the fresh file
+            self._bytes_written = size
+            return True
+        self._bytes_written += size
+        return False
 
 
 def setup_logging() -> None:
@@ -154,24 +197,35 @@ def setup_logging() -> None:
     if logger.handlers:
         return
 
-    level = getattr(logging, settings.log_level.upper(), logging.INFO)
+    level = getattr(logging, get_settings().log_level.upper(), logging.INFO)
     logger.setLevel(level)
 
     formatter = logging.Formatter(
         "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
     )
 
-    file_handler = RotatingFileHandler(
+    file_handler = FastRotatingFileHandler(
         "logs/server.log", maxBytes=10 * 1024 * 1024, backupCount=5
     )
     file_handler.setFormatter(formatter)
     file_handler.setLevel(level)
 
+    # Batch file writes in small groups; WARNING and above (including the
+    # [AUDIT] warnings) flush immediately so a hard kill loses little, and
+    # logging.shutdown() flushes the remainder at exit (flushOnClose).
+    buffered_file_handler = MemoryHandler(
+        capacity=64,
+        flushLevel=logging.WARNING,
+        target=file_handler,
+        flushOnClose=True,
+    )
+    buffered_file_handler.setLevel(level)
+
     console = logging.StreamHandler()
     console.setFormatter(formatter)
     console.setLevel(level)
 
-    logger.addHandler(file_handler)
+    logger.addHandler(buffered_file_handler)
     logger.addHandler(console)
 
     # Enable debug logging for aioapns and h2
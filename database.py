@@ -1,10 +1,12 @@
 """Database configuration for the Remote Job Server."""
 from __future__ import annotations
 
+import json
 from contextlib import contextmanager
 from typing import Generator
 
 from sqlalchemy import create_engine, event
+from sqlalchemy.ext.asyncio import async_sessionmaker, create_async_engine
 from sqlalchemy.orm import sessionmaker
 from sqlalchemy import text
 
@@ -20,16 +22,35 @@ engine = create_engine(
 )
 
 # v4.1: SQLite FOREIGN KEY制約を有効化（デフォルトOFFのため）
+# WAL + synchronous=NORMAL で短いトランザクションの commit を軽くする
+# busy_timeout: 同期セッション側の書き込みと衝突しても即 "database is locked" にせず待つ
 @event.listens_for(engine, "connect")
 def set_sqlite_pragma(dbapi_conn, connection_record):
-    """Enable FOREIGN KEY constraints for SQLite connections."""
+    """Enable FOREIGN KEY constraints and WAL journaling for SQLite connections."""
     cursor = dbapi_conn.cursor()
     cursor.execute("PRAGMA foreign_keys=ON")
+    cursor.execute("PRAGMA journal_mode=WAL")
+    cursor.execute("PRAGMA synchronous=NORMAL")
+    cursor.execute("PRAGMA busy_timeout=5000")
     cursor.close()
 
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 
+def _to_async_url(url: str) -> str:
+    """Map a sync SQLite URL onto the aiosqlite driver."""
+    if url.startswith("sqlite:"):
+        return "sqlite+aiosqlite:" + url[len("sqlite:"):]
+    return url
+
+
+# JobManager 用の非同期エンジン（イベントループをブロックしない）
+async_engine = create_async_engine(_to_async_url(DATABASE_URL))
+event.listen(async_engine.sync_engine, "connect", set_sqlite_pragma)
+
+AsyncSessionLocal = async_sessionmaker(bind=async_engine, autoflush=False, expire_on_commit=False)
+
+
 @contextmanager
 def session_scope() -> Generator:
     """Provide a transactional scope for DB operations."""
@@ -47,11 +68,16 @@ def session_scope() -> Generator:
 def init_db() -> None:
     """Create database tables based on model metadata."""
     # Import inside function to ensure models register with the Base metadata.
-    from models import Device, DeviceSession, Job, Room, Thread  # pylint: disable=import-outside-toplevel
+    from models import Device, DeviceSession, Job, Room, Thread, ThreadUnreadRunner  # pylint: disable=import-outside-toplevel
 
     Base.metadata.create_all(bind=engine)
     _ensure_room_settings_column()
     _ensure_thread_columns()
+    _ensure_room_indexes()
+    _ensure_thread_indexes()
+    _drop_redundant_job_indexes()
+    _ensure_device_session_unique_index()
+    _migrate_unread_runners()
 
 
 def _ensure_room_settings_column() -> None:
@@ -86,6 +112,14 @@ def _ensure_thread_columns() -> None:
             conn.execute(text(
                 "CREATE INDEX IF NOT EXISTS idx_jobs_room_thread ON jobs (room_id, thread_id)"
             ))
+        # jobs.room_name / jobs.thread_name（通知用の名前スナップショット）
+        if "room_name" not in jobs_cols:
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN room_name VARCHAR(100)"))
+        if "thread_name" not in jobs_cols:
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN thread_name VARCHAR(100)"))
+        # jobs.stdout_path（大きな stdout はファイルに保存し、stdout 列はプレビューのみ）
+        if "stdout_path" not in jobs_cols:
+            conn.execute(text("ALTER TABLE jobs ADD COLUMN stdout_path VARCHAR(255)"))
 
         # device_sessions.thread_id + unique index rebuild if absent
         ds_cols = [row[1] for row in conn.execute(text("PRAGMA table_info(device_sessions)"))]
@@ -111,8 +145,103 @@ def _ensure_thread_columns() -> None:
                 FROM device_sessions;
                 DROP TABLE device_sessions;
                 ALTER TABLE device_sessions_new RENAME TO device_sessions;
-                CREATE INDEX IF NOT EXISTS idx_device_room_runner_thread
-                    ON device_sessions (device_id, room_id, runner, thread_id);
                 PRAGMA foreign_keys=on;
                 """
             )
+
+
+def _ensure_room_indexes() -> None:
+    """Create indexes added to rooms after the table already existed.
+
+    ``create_all`` skips indexes of existing tables, so add them explicitly.
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_rooms_id_device ON rooms (id, device_id)"
+        ))
+
+
+def _ensure_thread_indexes() -> None:
+    """Create indexes added to threads after the table already existed."""
+
+    with engine.begin() as conn:
+        conn.execute(text(
+            "CREATE INDEX IF NOT EXISTS idx_threads_device_unread ON threads (device_id, has_unread)"
+        ))
+
+
+def _drop_redundant_job_indexes() -> None:
+    """Drop single-column job indexes covered by composite indexes.
+
+    idx_jobs_device_id is the left prefix of idx_jobs_device_room and
+    idx_jobs_room_id of idx_jobs_room_thread; keeping them only slows writes.
+    """
+
+    with engine.begin() as conn:
+        conn.execute(text("DROP INDEX IF EXISTS idx_jobs_device_id"))
+        conn.execute(text("DROP INDEX IF EXISTS idx_jobs_room_id"))
+
+
+_DEVICE_SESSION_KEY = ("device_id", "room_id", "runner", "thread_id")
+
+
+def _ensure_device_session_unique_index() -> None:
+    """Serve session lookups and upserts from one unique composite index.
+
+    The ON CONFLICT upsert in session_manager needs a unique index on
+    (device_id, room_id, runner, thread_id); create it if an old table lacks
+    one. The separate non-unique idx_device_room_runner_thread duplicates it
+    and is dropped.
+    """
+
+    with engine.begin() as conn:
+        has_unique = False
+        for row in conn.execute(text("PRAGMA index_list(device_sessions)")):
+            name, unique = row[1], row[2]
+            if not unique:
+                continue
+            cols = tuple(info[2] for info in conn.execute(text(f'PRAGMA index_info("{name}")')))
+            if cols == _DEVICE_SESSION_KEY:
+                has_unique = True
+                break
+        if not has_unique:
+            conn.execute(text(
+                "CREATE UNIQUE INDEX IF NOT EXISTS uq_device_room_runner_thread_idx "
+                "ON device_sessions (device_id, room_id, runner, thread_id)"
+            ))
+        conn.execute(text("DROP INDEX IF EXISTS idx_device_room_runner_thread"))
+
+
+def _migrate_unread_runners() -> None:
+    """Move legacy threads.unread_runners JSON arrays into thread_unread_runners.
+
+    Migrated rows have the legacy column cleared to NULL, so this is a no-op
+    after the first run (and on databases created without the column).
+    """
+
+    with engine.begin() as conn:
+        thread_cols = [row[1] for row in conn.execute(text("PRAGMA table_info(threads)"))]
+        if "unread_runners" not in thread_cols:
+            return
+
+        rows = conn.execute(text(
+            "SELECT id, unread_runners FROM threads WHERE unread_runners IS NOT NULL"
+        )).fetchall()
+        for thread_id, raw in rows:
+            try:
+                runners = json.loads(raw) if raw else []
+            except (json.JSONDecodeError, TypeError):
+                runners = []
+            if not isinstance(runners, list):
+                continue
+            for runner in runners:
+                conn.execute(
+                    text(
+                        "INSERT OR IGNORE INTO thread_unread_runners (thread_id, runner) "
+                        "VALUES (:thread_id, :runner)"
+                    ),
+                    {"thread_id": thread_id, "runner": runner},
+                )
+        if rows:
+            conn.execute(text("UPDATE threads SET unread_runners = NULL WHERE unread_runners IS NOT NULL"))
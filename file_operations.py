@@ -2,8 +2,11 @@
 from __future__ import annotations
 
 import os
+import time
 from dataclasses import dataclass
 from datetime import datetime, timezone
+from functools import lru_cache
+from operator import itemgetter
 from pathlib import Path
 from typing import Dict, List
 
@@ -16,8 +19,8 @@ from file_security import (
     FileSizeExceeded,
     InvalidExtension,
     InvalidPath,
-    get_source_language,
-    is_source_file,
+    _resolved_base,
+    classify_source_file,
     validate_file_path,
     validate_file_size,
     validate_image_extension,
@@ -34,6 +37,39 @@ MAX_IMAGE_SIZE = 100_000_000
 
 FileItemDict = Dict[str, object]
 
+# list_files のループ内で属性参照を繰り返さないよう束縛しておく
+_fromtimestamp = datetime.fromtimestamp
+_UTC = timezone.utc
+
+# 拡張子 -> list_files の type（ソースファイル以外）
+_SUFFIX_TO_TYPE: Dict[str, str] = {
+    ".md": "markdown_file",
+    ".pdf": "pdf_file",
+    **{ext: "image_file" for ext in ALLOWED_IMAGE_EXTENSIONS},
+}
+
+
+def _suffix_of(name: str) -> str:
+    """Return the lower-cased suffix of a file name (same rules as PurePath.suffix)."""
+    i = name.rfind(".")
+    if 0 < i < len(name) - 1:
+        return name[i:].lower()
+    return ""
+
+
+@lru_cache(maxsize=512)
+def _cached_is_file(path_str: str, time_bucket: int) -> bool:
+    return os.path.isfile(path_str)
+
+
+def _is_existing_file(target: Path) -> bool:
+    """Return whether target is a regular file, cached for ~1 second.
+
+    Results (negative ones included) are keyed on a 1-second monotonic bucket;
+    writes through this module clear the cache.
+    """
+    return _cached_is_file(str(target), int(time.monotonic()))
+
 
 @dataclass
 class WriteResult:
@@ -50,53 +86,53 @@ def list_files(workspace_path: str, relative_path: str) -> List[FileItemDict]:
         raise FileNotFoundError("Path is not a directory")
 
     results: List[FileItemDict] = []
-    base = Path(workspace_path).resolve()
-
-    for entry in sorted(target_dir.iterdir(), key=lambda p: p.name.lower()):
-        if entry.name.endswith(".bak"):
+    base = _resolved_base(workspace_path)
+    # target_dir は base 配下で解決済みなので、相対パスは entry.path の先頭を切り落とすだけで得られる
+    base_str = str(base)
+    base_prefix_len = len(base_str) if base_str.endswith(os.sep) else len(base_str) + 1
+
+    # os.scandir returns DirEntry objects whose type info comes from the
+    # directory read itself, so is_dir()/is_file() need no extra stat.
+    # 小文字化した名前を一度だけ作り、ソートキーと拡張子判定の両方に使う
+    with os.scandir(target_dir) as it:
+        entries = [(entry.name.lower(), entry) for entry in it]
+    entries.sort(key=itemgetter(0))
+
+    for name_lower, entry in entries:
+        name = entry.name
+        if name.endswith(".bak"):
             continue
         if entry.is_dir():
-            path = entry.relative_to(base).as_posix()
+            path = entry.path[base_prefix_len:].replace(os.sep, "/")
             results.append(
                 {
                     "id": path,
-                    "name": entry.name,
+                    "name": name,
                     "type": "directory",
                     "path": path,
                     "size": None,
-                    "modified_at": datetime.fromtimestamp(
-                        entry.stat().st_mtime, timezone.utc
-                    ).isoformat(),
+                    "modified_at": _fromtimestamp(entry.stat().st_mtime, _UTC).isoformat(),
                 }
             )
         elif entry.is_file():
-            suffix = entry.suffix.lower()
-            filename = entry.name.lower()
             language = None
-            
-            if suffix == ".md":
-                file_type = "markdown_file"
-            elif suffix == ".pdf":
-                file_type = "pdf_file"
-            elif suffix in ALLOWED_IMAGE_EXTENSIONS:
-                file_type = "image_file"
-            elif is_source_file(entry):
+            file_type = _SUFFIX_TO_TYPE.get(_suffix_of(name_lower))
+
+            if file_type is None:
+                is_source, language = classify_source_file(Path(name))
+                if not is_source:
+                    continue  # 未対応の拡張子はスキップ
                 file_type = "source_file"
-                language = get_source_language(entry)
-            else:
-                continue  # 未対応の拡張子はスキップ
 
             stat = entry.stat()
-            path = entry.relative_to(base).as_posix()
+            path = entry.path[base_prefix_len:].replace(os.sep, "/")
             item: FileItemDict = {
                 "id": path,
-                "name": entry.name,
+                "name": name,
                 "type": file_type,
                 "path": path,
                 "size": stat.st_size,
-                "modified_at": datetime.fromtimestamp(
-                    stat.st_mtime, timezone.utc
-                ).isoformat(),
+                "modified_at": _fromtimestamp(stat.st_mtime, _UTC).isoformat(),
             }
             if language:
                 item["language"] = language
@@ -106,7 +142,7 @@ def list_files(workspace_path: str, relative_path: str) -> List[FileItemDict]:
 
 def read_file(workspace_path: str, file_path: str) -> str:
     target = validate_file_path(workspace_path, file_path)
-    if not target.exists() or not target.is_file():
+    if not _is_existing_file(target):
         raise FileNotFoundError("File not found")
     validate_markdown_extension(target)
     validate_file_size(target, max_size=MAX_FILE_SIZE)
@@ -120,7 +156,9 @@ def write_file(workspace_path: str, file_path: str, content: str) -> WriteResult
     target = validate_file_path(workspace_path, file_path)
     validate_markdown_extension(target)
 
-    encoded_size = len(content.encode("utf-8"))
+    # 一度だけエンコードし、サイズ検証と書き込みの両方に使う
+    encoded = content.encode("utf-8", errors="strict")
+    encoded_size = len(encoded)
     if encoded_size > MAX_FILE_SIZE:
         raise FileSizeExceeded(size=encoded_size, limit=MAX_FILE_SIZE)
 
@@ -130,27 +168,31 @@ def write_file(workspace_path: str, file_path: str, content: str) -> WriteResult
     orig_mode = None
     backup_path = target.with_suffix(target.suffix + ".bak")
 
-    if target.exists():
-        stat = target.stat()
-        orig_mode = stat.st_mode
-        if backup_path.exists():
-            backup_path.unlink()
-        target.rename(backup_path)
+    # exists() + stat() の二重呼び出しを避け、stat 一回で存在確認とモード取得を兼ねる
+    try:
+        orig_mode = os.stat(target).st_mode
+    except FileNotFoundError:
+        pass
+    else:
+        # 既存バックアップは os.replace が原子的に上書きする
+        os.replace(target, backup_path)
         backup_created = True
 
-    with open(target, "w", encoding="utf-8", errors="strict") as f:
-        f.write(content)
+    with open(target, "wb") as f:
+        f.write(encoded)
 
     if orig_mode is not None:
         os.chmod(target, orig_mode)
 
+    _cached_is_file.cache_clear()
+
     return WriteResult(success=True, size=encoded_size, backup_created=backup_created)
 
 
 def read_pdf_file(workspace_path: str, file_path: str) -> bytes:
     """Read a PDF file as binary data."""
     target = validate_file_path(workspace_path, file_path)
-    if not target.exists() or not target.is_file():
+    if not _is_existing_file(target):
         raise FileNotFoundError("File not found")
     validate_pdf_extension(target)
     validate_file_size(target, max_size=MAX_PDF_SIZE)
@@ -160,7 +202,7 @@ def read_pdf_file(workspace_path: str, file_path: str) -> bytes:
 def read_image_file(workspace_path: str, file_path: str) -> bytes:
     """Read an image file as binary data."""
     target = validate_file_path(workspace_path, file_path)
-    if not target.exists() or not target.is_file():
+    if not _is_existing_file(target):
         raise FileNotFoundError("File not found")
     validate_image_extension(target)
     validate_file_size(target, max_size=MAX_IMAGE_SIZE)
@@ -181,7 +223,7 @@ def read_source_file(workspace_path: str, file_path: str) -> SourceFileResult:
     Returns the content and detected encoding.
     """
     target = validate_file_path(workspace_path, file_path)
-    if not target.exists() or not target.is_file():
+    if not _is_existing_file(target):
         raise FileNotFoundError("File not found")
     validate_source_extension(target)
     validate_file_size(target, max_size=MAX_SOURCE_SIZE)
@@ -215,14 +257,22 @@ def _generate_unique_filename(target: Path) -> Path:
     stem = target.stem
     suffix = target.suffix
     parent = target.parent
-    counter = 1
 
-    while True:
-        new_name = f"{stem}_{counter}{suffix}"
-        new_path = parent / new_name
-        if not new_path.exists():
-            return new_path
-        counter += 1
+    def _taken(counter: int) -> bool:
+        return os.path.lexists(str(parent / f"{stem}_{counter}{suffix}"))
+
+    # 1, 2, 4, 8, ... と指数的に探索して空き番号を見つけ、
+    # (lo, hi] を二分探索して最小の空き番号を絞り込む（O(log N) 回の stat）
+    lo, hi = 0, 1
+    while _taken(hi):
+        lo, hi = hi, hi * 2
+    while hi - lo > 1:
+        mid = (lo + hi) // 2
+        if _taken(mid):
+            lo = mid
+        else:
+            hi = mid
+    return parent / f"{stem}_{hi}{suffix}"
 
 
 @dataclass
@@ -259,9 +309,10 @@ def write_image_file(
 
     # 書き込み
     target.write_bytes(data)
+    _cached_is_file.cache_clear()
 
     # 保存されたパスを相対パスで返す
-    base = Path(workspace_path).resolve()
+    base = _resolved_base(workspace_path)
     saved_relative_path = target.relative_to(base).as_posix()
 
     return ImageWriteResult(success=True, size=len(data), saved_path=saved_relative_path)
@@ -2,6 +2,7 @@
 from __future__ import annotations
 
 from dataclasses import dataclass
+from functools import lru_cache
 from pathlib import Path
 from urllib.parse import unquote
 
@@ -31,6 +32,13 @@ class FileSizeExceeded(FileSecurityError):
         return f"File exceeds {self.limit} bytes (got {self.size})"
 
 
+@lru_cache(maxsize=32)
+def _resolved_base(workspace_path: str) -> Path:
+    """Resolve a workspace root once; roots are a small, bounded set."""
+
+    return Path(workspace_path).resolve()
+
+
 def validate_file_path(workspace_path: str, relative_path: str) -> Path:
     """Validate and resolve a relative path within a workspace.
 
@@ -39,10 +47,11 @@ def validate_file_path(workspace_path: str, relative_path: str) -> Path:
     - Resolves symlinks and ensures the target stays under the workspace root.
     """
 
-    decoded = unquote(unquote(relative_path))
-    normalized = decoded.replace("\\", "/")
+    # 大半のリクエストは素の POSIX パスなので、該当文字がなければ書き換えを省く
+    decoded = unquote(unquote(relative_path)) if "%" in relative_path else relative_path
+    normalized = decoded.replace("\\", "/") if "\\" in decoded else decoded
 
-    base = Path(workspace_path).resolve()
+    base = _resolved_base(workspace_path)
     target = (base / normalized).resolve()
 
     try:
@@ -89,9 +98,53 @@ PHASE2_SOURCE_FILENAMES = {
     "dockerfile", "makefile", "gnumakefile"
 }
 
+# Dockerfile / Dockerfile.* を判定するファイル名プレフィックス
+_DOCKERFILE_PREFIXES = ("dockerfile",)
+
 # 全対応ソースコード拡張子
 ALLOWED_SOURCE_EXTENSIONS = PHASE1_SOURCE_EXTENSIONS | PHASE2_SOURCE_EXTENSIONS
 
+# 拡張子 -> 言語識別子
+_EXTENSION_TO_LANGUAGE = {
+    ".swift": "swift",
+    ".py": "python",
+    ".js": "javascript",
+    ".jsx": "javascript",
+    ".ts": "typescript",
+    ".tsx": "typescript",
+    ".json": "json",
+    ".yaml": "yaml",
+    ".yml": "yaml",
+    ".sh": "shell",
+    ".bash": "shell",
+    ".zsh": "shell",
+    ".html": "html",
+    ".htm": "html",
+    ".css": "css",
+    ".scss": "scss",
+    ".less": "less",
+    ".go": "go",
+    ".rs": "rust",
+    ".rb": "ruby",
+    ".java": "java",
+    ".kt": "kotlin",
+    ".kts": "kotlin",
+    ".c": "c",
+    ".h": "c",
+    ".cpp": "cpp",
+    ".hpp": "cpp",
+    ".cc": "cpp",
+    ".cxx": "cpp",
+    ".cs": "csharp",
+    ".sql": "sql",
+    ".csv": "csv",
+    ".tsv": "tsv",
+    ".toml": "toml",
+    ".xml": "xml",
+    ".plist": "xml",
+    ".mk": "makefile",
+}
+
 # ソースファイルのサイズ上限（1MB）
 MAX_SOURCE_SIZE = 1_000_000
 
@@ -117,44 +170,44 @@ def validate_file_size(file_path: Path, max_size: int = MAX_FILE_SIZE) -> int:
     return size
 
 
-def validate_source_extension(file_path: Path) -> None:
-    """Ensure the path points to an allowed source code file.
-    
-    Checks both extension-based and filename-based patterns.
+def classify_source_file(file_path: Path) -> tuple[bool, str | None]:
+    """Classify a path as source code in a single pass.
+
+    Returns ``(is_source, language)``; language is None for non-source files.
     """
-    suffix = file_path.suffix.lower()
     filename = file_path.name.lower()
-    
+    dot = filename.rfind(".")
+    suffix = filename[dot:] if 0 < dot < len(filename) - 1 else ""
+
     # 拡張子ベースのチェック
     if suffix in ALLOWED_SOURCE_EXTENSIONS:
-        return
-    
-    # ファイル名ベースのチェック（Dockerfile, Makefile等）
+        return True, _EXTENSION_TO_LANGUAGE.get(suffix)
+
+    # Dockerfile / Dockerfile.* パターン
+    if filename.startswith(_DOCKERFILE_PREFIXES):
+        return True, "dockerfile"
+
+    # ファイル名ベースのチェック（Makefile, GNUmakefile）
     if filename in PHASE2_SOURCE_FILENAMES:
-        return
-    
-    # Dockerfile.* パターン
-    if filename.startswith("dockerfile"):
-        return
+        return True, "makefile"
+
+    return False, None
+
+
+def validate_source_extension(file_path: Path) -> None:
+    """Ensure the path points to an allowed source code file.
     
-    raise InvalidExtension(
-        f"Unsupported source file type: {file_path.name}"
-    )
+    Checks both extension-based and filename-based patterns.
+    """
+    if not classify_source_file(file_path)[0]:
+        raise InvalidExtension(
+            f"Unsupported source file type: {file_path.name}"
+        )
 
 
 def is_source_file(file_path: Path) -> bool:
     """Check if the path is a source code file."""
-    suffix = file_path.suffix.lower()
-    filename = file_path.name.lower()
-    
-    if suffix in ALLOWED_SOURCE_EXTENSIONS:
-        return True
-    if filename in PHASE2_SOURCE_FILENAMES:
-        return True
-    if filename.startswith("dockerfile"):
-        return True
-    
-    return False
+    return classify_source_file(file_path)[0]
 
 
 def get_source_language(file_path: Path) -> str | None:
@@ -162,58 +215,4 @@ def get_source_language(file_path: Path) -> str | None:
     
     Returns the language identifier or None if not a source file.
     """
-    suffix = file_path.suffix.lower()
-    filename = file_path.name.lower()
-    
-    # 拡張子から言語を推定
-    extension_to_language = {
-        ".swift": "swift",
-        ".py": "python",
-        ".js": "javascript",
-        ".jsx": "javascript",
-        ".ts": "typescript",
-        ".tsx": "typescript",
-        ".json": "json",
-        ".yaml": "yaml",
-        ".yml": "yaml",
-        ".sh": "shell",
-        ".bash": "shell",
-        ".zsh": "shell",
-        ".html": "html",
-        ".htm": "html",
-        ".css": "css",
-        ".scss": "scss",
-        ".less": "less",
-        ".go": "go",
-        ".rs": "rust",
-        ".rb": "ruby",
-        ".java": "java",
-        ".kt": "kotlin",
-        ".kts": "kotlin",
-        ".c": "c",
-        ".h": "c",
-        ".cpp": "cpp",
-        ".hpp": "cpp",
-        ".cc": "cpp",
-        ".cxx": "cpp",
-        ".cs": "csharp",
-        ".sql": "sql",
-        ".csv": "csv",
-        ".tsv": "tsv",
-        ".toml": "toml",
-        ".xml": "xml",
-        ".plist": "xml",
-        ".mk": "makefile",
-    }
-    
-    if suffix in extension_to_language:
-        return extension_to_language[suffix]
-    
-    # ファイル名ベースのチェック
-    if filename in PHASE2_SOURCE_FILENAMES or filename.startswith("dockerfile"):
-        if "dockerfile" in filename:
-            return "dockerfile"
-        if "makefile" in filename or filename == "gnumakefile":
-            return "makefile"
-    
-    return None
+    return classify_source_file(file_path)[1]
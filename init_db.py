@@ -6,11 +6,12 @@ from models import Device, utcnow
 def create_initial_device(device_id: str = "test-device-1", token: str = "dummy-token") -> None:
     db = SessionLocal()
     try:
+        now = utcnow()
         device = Device(
             device_id=device_id,
             device_token=token,
-            created_at=utcnow(),
-            updated_at=utcnow(),
+            created_at=now,
+            updated_at=now,
         )
         db.add(device)
         db.commit()
@@ -2,26 +2,71 @@
 from __future__ import annotations
 
 import asyncio
+import functools
 import logging
 import uuid
+from dataclasses import dataclass
 from datetime import datetime, timezone
-from typing import List, Optional, TYPE_CHECKING
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Set, Tuple, TYPE_CHECKING
 
-import httpx
+from sqlalchemy import func, insert, literal, select, update
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
 
-from database import SessionLocal
-from models import Job, Thread, Room
+from database import AsyncSessionLocal
+from models import Job, Thread, ThreadUnreadRunner, Room
 from session_manager import SessionManager
 from config import settings
 
 if TYPE_CHECKING:  # pragma: no cover
+    import httpx
+
     from sse_manager import SSEManager
 
 LOGGER = logging.getLogger(__name__)
 
 
+# 終了処理（未読設定・バッジ集計・通知）に必要な列
+_FINISH_RETURNING = (
+    Job.runner,
+    Job.device_id,
+    Job.thread_id,
+    Job.notify_token,
+    Job.room_name,
+    Job.thread_name,
+)
+
+
+# 終了していないジョブの状態（シャットダウン時・起動時に failed へ落とす対象）
+_UNFINISHED_STATUSES = ("queued", "running")
+_SHUTDOWN_STDERR = "Server shutdown"
+
+
+# datetime.now に渡すたびに属性参照しないよう束縛しておく
+_UTC = timezone.utc
+
+
+# ファイルに逃がした stdout のうち、jobs.stdout に残すプレビューの長さ
+STDOUT_PREVIEW_CHARS = 500
+
+
+# 終了処理のバッチ化: 最初の1件から最大この時間だけ待ち、まとめて1トランザクションで commit する
+FINALIZE_BATCH_WINDOW = 0.01
+FINALIZE_BATCH_MAX = 32
+
+
 def utcnow() -> datetime:
-    return datetime.now(timezone.utc)
+    return datetime.now(_UTC)
+
+
+@dataclass
+class _FinalizeRequest:
+    """A terminal job state waiting for the finalizer to persist it."""
+
+    job_id: str
+    values: Dict[str, Any]
+    # (RETURNING row, badge count), or None if the job row no longer exists
+    done: asyncio.Future
 
 
 class JobManager:
@@ -35,8 +80,24 @@ class JobManager:
         self.session_manager = session_manager or SessionManager()
         self.sse_manager = sse_manager
         self.notification_server_url = settings.notification_server_url
-
-    def create_job(  # pylint: disable=too-many-arguments
+        # Strong references to in-flight job tasks (asyncio only keeps weak ones)
+        self._tasks: Set[asyncio.Task] = set()
+        # Bounded concurrency: jobs beyond the limit stay "queued" until a slot frees
+        self.max_concurrent_jobs = settings.max_concurrent_jobs
+        self._job_slots = asyncio.Semaphore(self.max_concurrent_jobs)
+        # Large outputs go to files so the finish transaction stays small
+        self.job_output_dir = Path(settings.job_output_dir)
+        self.stdout_inline_limit = settings.job_stdout_inline_limit
+        # Single writer: SQLite allows one writer at a time, so job write
+        # transactions queue here instead of spinning on busy_timeout
+        self._write_lock = asyncio.Lock()
+        # Jobs finishing together share one commit (see _run_finalizer)
+        self._finalize_queue: asyncio.Queue = asyncio.Queue()
+        self._finalizer_task: Optional[asyncio.Task] = None
+        # Shared keep-alive client, created on the first notification
+        self._http_client: Optional["httpx.AsyncClient"] = None
+
+    async def create_job(  # pylint: disable=too-many-arguments
         self,
         runner: str,
         input_text: str,
@@ -46,202 +107,367 @@ class JobManager:
         settings: Optional[dict] = None,
         thread_id: Optional[str] = None,
         notify_token: Optional[str] = None,
-        background_tasks: Optional[object] = None,
     ) -> dict:
-        job = Job(
-            id=str(uuid.uuid4()),
-            runner=runner,
-            input_text=input_text,
-            device_id=device_id,
-            room_id=room_id,
-            thread_id=thread_id,
-            status="queued",
-            notify_token=notify_token,
-            created_at=utcnow(),
-        )
-        db = SessionLocal()
-        try:
-            db.add(job)
-            db.commit()
-            db.refresh(job)
-        finally:
-            db.close()
-
-        if background_tasks is not None:
-            background_tasks.add_task(self._execute_job, job.id, workspace_path, settings)
-        else:
-            self._execute_job(job.id, workspace_path, settings)
-
-        return job.to_dict()
-
-    def _execute_job(self, job_id: str, workspace_path: str, settings: Optional[dict]) -> None:
-        db = SessionLocal()
-        try:
-            job = db.query(Job).filter_by(id=job_id).first()
-            if not job:
-                LOGGER.warning("Job %s not found", job_id)
-                return
-
-            job.status = "running"
-            job.started_at = utcnow()
-            db.commit()
-            self._broadcast_job_event(
+        async with AsyncSessionLocal() as db:
+            # 通知文言用の名前を1クエリでスナップショット（完了時の再検索を不要にする）
+            names = (await db.execute(
+                select(Room.name, Thread.name)
+                .select_from(Room)
+                .outerjoin(Thread, Thread.id == thread_id)
+                .where(Room.id == room_id)
+            )).first()
+            room_name, thread_name = names if names else (None, None)
+
+            # 全列をクライアント側で確定しているので、ORM の flush/refresh を介さず INSERT 1文で書く
+            row = {
+                "id": str(uuid.uuid4()),
+                "runner": runner,
+                "input_text": input_text,
+                "device_id": device_id,
+                "room_id": room_id,
+                "thread_id": thread_id,
+                "status": "queued",
+                "notify_token": notify_token,
+                "room_name": room_name,
+                "thread_name": thread_name,
+                "created_at": utcnow(),
+            }
+            async with self._write_lock:
+                await db.execute(insert(Job), [row])
+                await db.commit()
+
+        # Run on the event loop; the CLI itself runs as an asyncio subprocess
+        task = asyncio.create_task(self._run_with_slot(row["id"], workspace_path, settings))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+        return Job(**row).to_dict()
+
+    async def _run_with_slot(self, job_id: str, workspace_path: str, settings: Optional[dict]) -> None:
+        """Execute a job once one of the max_concurrent_jobs slots is free."""
+        if self._job_slots.locked():
+            LOGGER.info(
+                "Job %s waiting for a free slot (limit=%d, pending=%d)",
                 job_id,
-                {
-                    "status": job.status,
-                    "started_at": job.started_at.isoformat(),
-                },
-            )
-
-            LOGGER.info("Executing job %s (%s) in workspace %s", job_id, job.runner, workspace_path)
-            result = self.session_manager.execute_job(
-                runner=job.runner,
-                prompt=job.input_text,
-                device_id=job.device_id,
-                room_id=job.room_id,
-                thread_id=job.thread_id,
-                workspace_path=workspace_path,
-                continue_session=True,
-                settings=settings,
+                self.max_concurrent_jobs,
+                len(self._tasks),
             )
+        try:
+            async with self._job_slots:
+                await self._execute_job(job_id, workspace_path, settings)
+        except asyncio.CancelledError:
+            # シャットダウンで打ち切られたジョブを queued/running のまま残さない
+            await self._mark_unfinished_failed(job_id)
+            raise
 
-            if result.get("success"):
-                job.status = "success"
-                job.exit_code = 0
-                job.stdout = result.get("output", "")
-                job.stderr = ""
-            else:
-                job.status = "failed"
-                job.exit_code = 1
-                job.stdout = result.get("output", "")
-                job.stderr = result.get("error", "")
-
-            job.finished_at = utcnow()
-
-            # v4.3.1: スレッドにrunner別未読フラグを設定
-            if job.thread_id:
-                thread = db.query(Thread).filter_by(id=job.thread_id).first()
-                if thread:
-                    import json
-                    unread_list = []
-                    if thread.unread_runners:
-                        try:
-                            unread_list = json.loads(thread.unread_runners)
-                        except (json.JSONDecodeError, TypeError):
-                            unread_list = []
-                    if job.runner not in unread_list:
-                        unread_list.append(job.runner)
-                    thread.unread_runners = json.dumps(unread_list)
-                    thread.has_unread = True
-                    LOGGER.info("Set unread_runners=%s for thread %s", unread_list, job.thread_id)
+    async def _mark_unfinished_failed(self, job_id: Optional[str] = None) -> int:
+        """Mark queued/running jobs (or just job_id) as failed with a shutdown stderr.
 
-            # v4.3.2: コミット前にbadge_countを取得（この時点で未読フラグは設定済み）
-            # db.flush()で変更をDBに反映してからカウント
-            db.flush()
-            badge_count = db.query(Thread).join(Room).filter(
-                Room.device_id == job.device_id,
-                Thread.has_unread == True,  # noqa: E712
-            ).count()
-            LOGGER.info("🔔 Badge count for device %s: %d (before commit)", job.device_id, badge_count)
-
-            db.commit()
-            self._broadcast_job_event(
-                job_id,
-                {
-                    "status": job.status,
-                    "finished_at": job.finished_at.isoformat(),
-                    "exit_code": job.exit_code,
-                },
-                close_stream=True,
-            )
-
-            # Send push notification via VPS
-            if job.notify_token:
-                LOGGER.info("🔔 Sending notification for token=%s with badge=%d", job.notify_token[:8], badge_count)
-                try:
-                    # Room名とスレッド名を取得
-                    room = db.query(Room).filter_by(id=job.room_id).first()
-                    thread = db.query(Thread).filter_by(id=job.thread_id).first()
-                    room_name = room.name if room else "Unknown"
-                    thread_name = thread.name if thread else "Default"
-
-                    self._send_notification_via_vps(
-                        device_token=job.notify_token,
-                        title="推論完了",
-                        body=f"{room_name}/{thread_name} - {job.runner}",
-                        badge=badge_count,
-                    )
-                except Exception as e:
-                    LOGGER.error("Failed to send notification: %s", e)
-            else:
-                LOGGER.debug("🔔 No notify_token, skipping notification")
+        Uses its own short session and skips SSE/push; returns the row count.
+        """
+        stmt = update(Job).where(Job.status.in_(_UNFINISHED_STATUSES))
+        if job_id is not None:
+            stmt = stmt.where(Job.id == job_id)
+        stmt = stmt.values(
+            status="failed",
+            exit_code=1,
+            stderr=_SHUTDOWN_STDERR,
+            finished_at=utcnow(),
+        ).execution_options(synchronize_session=False)
+        try:
+            async with AsyncSessionLocal() as db:
+                async with self._write_lock:
+                    result = await db.execute(stmt)
+                    await db.commit()
         except Exception:  # pylint: disable=broad-except
-            LOGGER.exception("Job %s execution failed", job_id)
-            job = db.query(Job).filter_by(id=job_id).first()
-            if job:
-                job.status = "failed"
-                job.exit_code = 1
-                job.stderr = "Internal error"
-                job.finished_at = utcnow()
-
-                # v4.3.1: スレッドにrunner別未読フラグを設定（エラー時も通知）
-                if job.thread_id:
-                    thread = db.query(Thread).filter_by(id=job.thread_id).first()
-                    if thread:
-                        import json
-                        unread_list = []
-                        if thread.unread_runners:
-                            try:
-                                unread_list = json.loads(thread.unread_runners)
-                            except (json.JSONDecodeError, TypeError):
-                                unread_list = []
-                        if job.runner not in unread_list:
-                            unread_list.append(job.runner)
-                        thread.unread_runners = json.dumps(unread_list)
-                        thread.has_unread = True
-                        LOGGER.info("Set unread_runners=%s for thread %s (error)", unread_list, job.thread_id)
-
-                # v4.3.2: コミット前にbadge_countを取得
-                db.flush()
-                badge_count = db.query(Thread).join(Room).filter(
-                    Room.device_id == job.device_id,
-                    Thread.has_unread == True,  # noqa: E712
-                ).count()
-                LOGGER.info("🔔 Badge count for device %s: %d (error, before commit)", job.device_id, badge_count)
-
-                db.commit()
-                self._broadcast_job_event(
+            LOGGER.exception("Failed to mark interrupted job(s) as failed (job_id=%s)", job_id)
+            return 0
+        return result.rowcount
+
+    async def fail_interrupted_jobs(self) -> None:
+        """Fail jobs left queued/running by a previous process; call once at startup."""
+        count = await self._mark_unfinished_failed()
+        if count:
+            LOGGER.warning("Marked %d job(s) interrupted by a previous shutdown as failed", count)
+
+    async def _execute_job(self, job_id: str, workspace_path: str, settings: Optional[dict]) -> None:
+        async with AsyncSessionLocal() as db:
+            try:
+                job = (await db.execute(select(Job).where(Job.id == job_id))).scalar_one_or_none()
+                if not job:
+                    LOGGER.warning("Job %s not found", job_id)
+                    return
+
+                # 状態遷移はORMオブジェクトを経由せず UPDATE 1文で行う
+                started_at = utcnow()
+                async with self._write_lock:
+                    await db.execute(
+                        update(Job)
+                        .where(Job.id == job_id)
+                        .values(status="running", started_at=started_at)
+                        .execution_options(synchronize_session=False)
+                    )
+                    await db.commit()
+                await self._broadcast_job_event(
                     job_id,
                     {
-                        "status": job.status,
-                        "finished_at": job.finished_at.isoformat(),
-                        "exit_code": job.exit_code,
+                        "status": "running",
+                        "started_at": started_at.isoformat(),
                     },
-                    close_stream=True,
                 )
 
-                # Send push notification via VPS
-                if job.notify_token:
-                    LOGGER.info("🔔 Sending notification (error) for token=%s with badge=%d", job.notify_token[:8], badge_count)
-                    try:
-                        # Room名とスレッド名を取得
-                        room = db.query(Room).filter_by(id=job.room_id).first()
-                        thread = db.query(Thread).filter_by(id=job.thread_id).first()
-                        room_name = room.name if room else "Unknown"
-                        thread_name = thread.name if thread else "Default"
-
-                        self._send_notification_via_vps(
-                            device_token=job.notify_token,
-                            title="推論失敗",
-                            body=f"{room_name}/{thread_name} - {job.runner}",
-                            badge=badge_count,
-                        )
-                    except Exception as e:
-                        LOGGER.error("Failed to send notification: %s", e)
-        finally:
-            db.close()
-
-    def _send_notification_via_vps(
+                LOGGER.info("Executing job %s (%s) in workspace %s", job_id, job.runner, workspace_path)
+                # CLI は非同期サブプロセスで実行するので、待機中もイベントループは塞がない
+                result = await self.session_manager.execute_job(
+                    runner=job.runner,
+                    prompt=job.input_text,
+                    device_id=job.device_id,
+                    room_id=job.room_id,
+                    thread_id=job.thread_id,
+                    workspace_path=workspace_path,
+                    continue_session=True,
+                    settings=settings,
+                    on_output=functools.partial(self._broadcast_output, job_id),
+                )
+
+                if result.get("success"):
+                    status, exit_code, stderr = "success", 0, ""
+                else:
+                    status, exit_code, stderr = "failed", 1, result.get("error", "")
+
+                stdout, stdout_path = await self._store_stdout(job_id, result.get("output", ""))
+                await self._finalize_job(
+                    job_id,
+                    status=status,
+                    exit_code=exit_code,
+                    stdout=stdout,
+                    stdout_path=stdout_path,
+                    stderr=stderr,
+                    notify_title="推論完了",
+                )
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Job %s execution failed", job_id)
+                await db.rollback()
+                # v4.3.1: エラー時もスレッド未読・通知を行う
+                await self._finalize_job(
+                    job_id,
+                    status="failed",
+                    exit_code=1,
+                    stderr="Internal error",
+                    notify_title="推論失敗",
+                )
+
+    async def _finalize_job(  # pylint: disable=too-many-arguments
+        self,
+        job_id: str,
+        *,
+        status: str,
+        exit_code: int,
+        stderr: str,
+        notify_title: str,
+        stdout: Optional[str] = None,
+        stdout_path: Optional[str] = None,
+    ) -> None:
+        """Persist a terminal job state, then broadcast and notify.
+
+        The terminal UPDATE, unread marking and badge count are applied by the
+        finalizer together with other jobs finishing in the same window; SSE
+        and push notification follow once that batch has committed.
+        """
+        finished_at = utcnow()
+        values = {
+            "status": status,
+            "exit_code": exit_code,
+            "stderr": stderr,
+            "finished_at": finished_at,
+        }
+        if stdout is not None:
+            values["stdout"] = stdout
+            values["stdout_path"] = stdout_path
+
+        request = _FinalizeRequest(job_id, values, asyncio.get_running_loop().create_future())
+        if self._finalizer_task is None or self._finalizer_task.done():
+            self._finalizer_task = asyncio.create_task(self._run_finalizer())
+        await self._finalize_queue.put(request)
+
+        outcome = await request.done
+        if outcome is None:
+            LOGGER.warning("Job %s disappeared before it could be finalized", job_id)
+            return
+        finished, badge_count = outcome
+        LOGGER.info("🔔 Badge count for device %s: %d", finished.device_id, badge_count)
+
+        await self._broadcast_job_event(
+            job_id,
+            {
+                "status": status,
+                "finished_at": finished_at.isoformat(),
+                "exit_code": exit_code,
+            },
+            close_stream=True,
+        )
+
+        # Send push notification via VPS
+        if finished.notify_token:
+            LOGGER.info("🔔 Sending notification for token=%s with badge=%d", finished.notify_token[:8], badge_count)
+            try:
+                # Room名とスレッド名は作成時のスナップショットを使う
+                room_name = finished.room_name or "Unknown"
+                thread_name = finished.thread_name or "Default"
+
+                await self._send_notification_via_vps(
+                    device_token=finished.notify_token,
+                    title=notify_title,
+                    body=f"{room_name}/{thread_name} - {finished.runner}",
+                    badge=badge_count,
+                )
+            except Exception as e:
+                LOGGER.error("Failed to send notification: %s", e)
+        else:
+            LOGGER.debug("🔔 No notify_token, skipping notification")
+
+    async def _run_finalizer(self) -> None:
+        """Drain finished jobs and persist them in batched transactions."""
+        loop = asyncio.get_running_loop()
+        while True:
+            batch = [await self._finalize_queue.get()]
+            deadline = loop.time() + FINALIZE_BATCH_WINDOW
+            while len(batch) < FINALIZE_BATCH_MAX:
+                timeout = deadline - loop.time()
+                if timeout <= 0:
+                    break
+                try:
+                    batch.append(await asyncio.wait_for(self._finalize_queue.get(), timeout))
+                except asyncio.TimeoutError:
+                    break
+
+            if len(batch) == 1:
+                await self._resolve_finalize(batch)
+                continue
+            try:
+                outcomes = await self._apply_finalize_batch(batch)
+            except Exception:  # pylint: disable=broad-except
+                # 1件の失敗で他のジョブを巻き込まないよう、1件ずつやり直す
+                LOGGER.exception("Batched finalize of %d jobs failed, retrying one by one", len(batch))
+                for request in batch:
+                    await self._resolve_finalize([request])
+                continue
+            for request, outcome in zip(batch, outcomes):
+                if not request.done.done():
+                    request.done.set_result(outcome)
+
+    async def _resolve_finalize(self, batch: List[_FinalizeRequest]) -> None:
+        """Apply a batch and settle its futures, propagating any failure to the waiters."""
+        try:
+            outcomes = await self._apply_finalize_batch(batch)
+        except Exception as exc:  # pylint: disable=broad-except
+            for request in batch:
+                if not request.done.done():
+                    request.done.set_exception(exc)
+            return
+        for request, outcome in zip(batch, outcomes):
+            if not request.done.done():
+                request.done.set_result(outcome)
+
+    async def _apply_finalize_batch(
+        self, batch: List[_FinalizeRequest]
+    ) -> List[Optional[Tuple[Any, int]]]:
+        """Write terminal states for a batch of jobs in one transaction.
+
+        Returns, per request, the RETURNING row and the device's badge count
+        (None if the job row no longer exists).
+        """
+        async with self._write_lock, AsyncSessionLocal() as db:
+            rows = []
+            for request in batch:
+                # 終了状態の UPDATE で後続処理に要る列を RETURNING で受け取る
+                finished = (await db.execute(
+                    update(Job)
+                    .where(Job.id == request.job_id)
+                    .values(**request.values)
+                    .returning(*_FINISH_RETURNING)
+                    .execution_options(synchronize_session=False)
+                )).first()
+                if finished:
+                    # v4.3.1: スレッドにrunner別未読フラグを設定
+                    await self._mark_thread_unread(db, finished)
+                rows.append(finished)
+
+            # v4.3.2: コミット前にbadge_countを取得（この時点で未読フラグは設定済み）
+            # バッチ内のデバイスごとに1回ではなく、GROUP BY で1クエリにまとめる
+            device_ids = {row.device_id for row in rows if row}
+            badge_counts: Dict[str, int] = {}
+            if device_ids:
+                badge_counts = dict((await db.execute(
+                    select(Thread.device_id, func.count())
+                    .where(Thread.device_id.in_(device_ids), Thread.has_unread.is_(True))
+                    .group_by(Thread.device_id)
+                )).all())
+
+            await db.commit()
+
+        if len(batch) > 1:
+            LOGGER.info("Finalized %d jobs in one transaction", len(batch))
+        return [(row, badge_counts.get(row.device_id, 0)) if row else None for row in rows]
+
+    async def _store_stdout(self, job_id: str, output: str) -> tuple[str, Optional[str]]:
+        """Return (stdout column value, stdout_path) for a finished job's output.
+
+        Outputs above stdout_inline_limit are written to job_output_dir and only
+        a preview is kept in the row; on write failure the full text stays inline.
+        """
+        if len(output) <= self.stdout_inline_limit:
+            return output, None
+
+        path = self.job_output_dir / f"{job_id}.out"
+
+        def _write() -> None:
+            path.parent.mkdir(parents=True, exist_ok=True)
+            path.write_text(output, encoding="utf-8")
+
+        try:
+            await asyncio.to_thread(_write)
+        except OSError as exc:
+            LOGGER.warning("Failed to offload stdout for job %s, storing inline: %s", job_id, exc)
+            return output, None
+        return output[:STDOUT_PREVIEW_CHARS], str(path)
+
+    async def _mark_thread_unread(self, db, finished) -> None:
+        """Flag the finished job's runner as unread on its thread (same transaction)."""
+        if not finished.thread_id:
+            return
+        # INSERT ... SELECT なので、実行中にスレッドが削除されていれば何も挿入しない
+        await db.execute(
+            sqlite_insert(ThreadUnreadRunner)
+            .from_select(
+                ["thread_id", "runner"],
+                select(Thread.id, literal(finished.runner)).where(Thread.id == finished.thread_id),
+            )
+            .on_conflict_do_nothing()
+        )
+        await db.execute(
+            update(Thread)
+            .where(Thread.id == finished.thread_id)
+            .values(has_unread=True)
+            .execution_options(synchronize_session=False)
+        )
+        LOGGER.info("Set unread runner=%s for thread %s", finished.runner, finished.thread_id)
+
+    def _get_http_client(self) -> "httpx.AsyncClient":
+        """Return the shared notification client, importing httpx on first use."""
+        if self._http_client is None:
+            # 通知を送らない構成では httpx の import 自体を省く
+            import httpx
+
+            # Shared keep-alive client so notification bursts reuse one TLS connection
+            self._http_client = httpx.AsyncClient(
+                http2=True,
+                timeout=30.0,
+                limits=httpx.Limits(max_keepalive_connections=32),
+            )
+        return self._http_client
+
+    async def _send_notification_via_vps(
         self,
         device_token: str,
         title: str,
@@ -272,55 +498,77 @@ class JobManager:
             if badge is not None:
                 payload["badge"] = badge
 
-            with httpx.Client(timeout=30.0) as client:
-                response = client.post(
-                    self.notification_server_url,
-                    json=payload,
-                    headers={"Content-Type": "application/json"},
-                )
+            response = await self._get_http_client().post(
+                self.notification_server_url,
+                json=payload,
+                headers={"Content-Type": "application/json"},
+            )
 
-                if response.status_code == 200:
-                    LOGGER.info("📱 Notification sent via VPS to %s: %s", device_token[:8], title)
-                    return True
-                else:
-                    LOGGER.error(
-                        "Failed to send notification via VPS to %s: HTTP %d - %s",
-                        device_token[:8],
-                        response.status_code,
-                        response.text,
-                    )
-                    return False
+            if response.status_code == 200:
+                LOGGER.info("📱 Notification sent via VPS to %s: %s", device_token[:8], title)
+                return True
+            else:
+                LOGGER.error(
+                    "Failed to send notification via VPS to %s: HTTP %d - %s",
+                    device_token[:8],
+                    response.status_code,
+                    response.text,
+                )
+                return False
 
         except Exception as exc:
             LOGGER.error("Failed to send notification via VPS to %s: %s", device_token[:8], exc)
             return False
 
-    def get_jobs(
+    async def aclose(self) -> None:
+        """Cancel outstanding job tasks (each marks its job failed) and close the notification HTTP client."""
+        tasks = list(self._tasks)
+        for task in tasks:
+            task.cancel()
+        if tasks:
+            await asyncio.gather(*tasks, return_exceptions=True)
+        if self._finalizer_task is not None:
+            self._finalizer_task.cancel()
+            await asyncio.gather(self._finalizer_task, return_exceptions=True)
+            self._finalizer_task = None
+        if self._http_client is not None:
+            await self._http_client.aclose()
+            self._http_client = None
+
+    async def get_jobs(
         self,
         limit: int = 20,
         status: Optional[str] = None,
         device_id: Optional[str] = None,
     ) -> List[dict]:
-        db = SessionLocal()
-        try:
-            query = db.query(Job).order_by(Job.created_at.desc())
-            if status:
-                query = query.filter_by(status=status)
-            if device_id:
-                query = query.filter_by(device_id=device_id)
-            return [job.to_dict() for job in query.limit(limit).all()]
-        finally:
-            db.close()
-
-    def get_job(self, job_id: str) -> Optional[dict]:
-        db = SessionLocal()
-        try:
-            job = db.query(Job).filter_by(id=job_id).first()
-            return job.to_dict() if job else None
-        finally:
-            db.close()
+        stmt = select(Job).order_by(Job.created_at.desc())
+        if status:
+            stmt = stmt.where(Job.status == status)
+        if device_id:
+            stmt = stmt.where(Job.device_id == device_id)
+        async with AsyncSessionLocal() as db:
+            result = await db.execute(stmt.limit(limit))
+            # 一覧はプレビューのみ返し、ファイルに逃がした stdout は読まない
+            return [job.to_dict(full_stdout=False) for job in result.scalars()]
+
+    async def get_job(self, job_id: str, full_stdout: bool = True) -> Optional[dict]:
+        async with AsyncSessionLocal() as db:
+            job = (await db.execute(select(Job).where(Job.id == job_id))).scalar_one_or_none()
+        if job is None:
+            return None
+        data = job.to_dict(full_stdout=False)
+        if full_stdout and job.stdout_path:
+            # ファイルに逃がした stdout は数MBになり得るので、読み込みはイベントループ外で行う
+            data["stdout"] = await asyncio.to_thread(job.read_stdout)
+        return data
+
+    async def _broadcast_output(self, job_id: str, stream: str, text: str) -> None:
+        """Forward a line of live CLI output to the job's SSE subscribers."""
+        if self.sse_manager is None or not self.sse_manager.subscribers(job_id):
+            return
+        await self.sse_manager.broadcast(job_id, {"chunk": text, "stream": stream})
 
-    def _broadcast_job_event(
+    async def _broadcast_job_event(
         self,
         job_id: str,
         payload: dict,
@@ -331,45 +579,21 @@ class JobManager:
             LOGGER.warning("SSE manager not configured, skipping broadcast for job %s", job_id)
             return
 
-        subscribers = len(getattr(self.sse_manager, "_connections", {}).get(job_id, []))
-        LOGGER.info(
-            "Broadcasting SSE event for job %s: %s (subscribers=%d, close_stream=%s)",
-            job_id,
-            payload,
-            subscribers,
-            close_stream,
-        )
-
-        async def _runner() -> None:
-            await self.sse_manager.broadcast(job_id, payload)
-            if close_stream:
-                await self.sse_manager.close(job_id)
-
-        self._run_async(_runner())
-
-    def _run_async(self, coro) -> None:
-        if not self.sse_manager:
-            LOGGER.warning("_run_async called but sse_manager is None")
+        subscribers = self.sse_manager.subscribers(job_id)
+        if not subscribers:
+            # 購読者がいなければ broadcast/close とも何もしないので、ここで打ち切る
+            LOGGER.debug("No SSE subscribers for job %s, skipping broadcast", job_id)
             return
+        # payload の repr 整形は INFO が無効なら行わない
+        if LOGGER.isEnabledFor(logging.INFO):
+            LOGGER.info(
+                "Broadcasting SSE event for job %s: %s (subscribers=%d, close_stream=%s)",
+                job_id,
+                payload,
+                subscribers,
+                close_stream,
+            )
 
-        loop = getattr(self.sse_manager, "loop", None)
-
-        if loop and not loop.is_closed():
-            try:
-                current_loop = asyncio.get_running_loop()
-            except RuntimeError:
-                current_loop = None
-
-            try:
-                if current_loop is loop:
-                    loop.create_task(coro)
-                else:
-                    asyncio.run_coroutine_threadsafe(coro, loop)
-                return
-            except Exception as exc:  # pragma: no cover - scheduling errors
-                LOGGER.warning("Failed to schedule SSE coroutine threadsafe: %s", exc, exc_info=True)
-
-        try:
-            asyncio.run(coro)
-        except RuntimeError as exc:  # pragma: no cover - nested loop
-            LOGGER.warning("Failed to run SSE coroutine: %s", exc, exc_info=True)
+        await self.sse_manager.broadcast(job_id, payload)
+        if close_stream:
+            await self.sse_manager.close(job_id)
@@ -2,13 +2,14 @@
 from __future__ import annotations
 
 import asyncio
+import ipaddress
 import uuid
 import json
 import logging
-from typing import List, Optional
+from pathlib import Path
+from typing import List, Optional, Tuple
 
 from fastapi import (
-    BackgroundTasks,
     Depends,
     FastAPI,
     File,
@@ -23,28 +24,39 @@ from fastapi import (
 from fastapi.middleware.cors import CORSMiddleware
 from fastapi.responses import StreamingResponse
 from pydantic import BaseModel
-from sqlalchemy.orm import Session
+from sqlalchemy import func, select
+from sqlalchemy.orm import Session, selectinload
 from contextlib import asynccontextmanager
 
 from config import setup_logging, settings, get_ssl_paths, is_certificate_fallback_warning
 from cert_generator import (
-    ensure_certificate_exists,
+    ensure_certificate_exists_async,
     get_certificate_fingerprint,
     get_certificate_info,
-    regenerate_certificate,
+    regenerate_certificate_async,
     revoke_certificate,
     print_certificate_banner,
 )
 from bonjour_publisher import (
     start_bonjour_service_async,
     stop_bonjour_service_async,
-    update_bonjour_fingerprint,
+    update_bonjour_fingerprint_async,
 )
 from database import SessionLocal, init_db
 from job_manager import JobManager
-from models import Device, DeviceSession, Job, Room, Thread, InvitationCode, SubdomainRegistration, utcnow
+from models import (
+    Device,
+    DeviceSession,
+    Job,
+    Room,
+    Thread,
+    ThreadUnreadRunner,
+    InvitationCode,
+    SubdomainRegistration,
+    utcnow,
+)
 from session_manager import SessionManager
-from sse_manager import sse_manager
+from sse_manager import SSE_QUEUE_MAXSIZE, sse_manager
 from utils.path_validator import validate_workspace_path
 from utils.settings_validator import (
     ALLOWED_VALUES,
@@ -52,9 +64,10 @@ from utils.settings_validator import (
     DANGEROUS_FLAGS,
     SHELL_META_CHARS,
     ValidationError,
+    parse_settings_json,
     validate_settings,
 )
-from auth_helpers import verify_room_ownership
+from auth_helpers import invalidate_room, verify_room_ownership, verify_room_ownership_id_only
 from file_operations import (
     list_files,
     read_file,
@@ -93,6 +106,8 @@ async def lifespan(app: FastAPI):  # noqa: D417 - FastAPI lifespan signature
     global _pending_cert_restart, _pending_cert_fingerprint
 
     init_db()
+    # 前回のプロセス終了で queued/running のまま残ったジョブを failed にする
+    await job_manager.fail_interrupted_jobs()
 
     # Initialize SSL certificate
     try:
@@ -101,7 +116,7 @@ async def lifespan(app: FastAPI):  # noqa: D417 - FastAPI lifespan signature
 
         # For self-signed mode, ensure certificate exists
         if mode_used == "self_signed" and settings.ssl_auto_generate:
-            cert_path, key_path, fingerprint = ensure_certificate_exists(
+            cert_path, key_path, fingerprint = await ensure_certificate_exists_async(
                 hostname=settings.server_hostname,
                 san_ips=settings.get_san_ips_list(),
             )
@@ -147,6 +162,11 @@ async def lifespan(app: FastAPI):  # noqa: D417 - FastAPI lifespan signature
 
     yield
 
+    # Cleanup: Close the shared VPS notification client
+    await job_manager.aclose()
+    # Cleanup: Flush session IDs still queued for the DB
+    await session_manager.aclose()
+
     # Cleanup: Stop Bonjour service
     if settings.bonjour_enabled:
         try:
@@ -169,6 +189,7 @@ app.add_middleware(
 session_manager = SessionManager()
 job_manager = JobManager(session_manager=session_manager, sse_manager=sse_manager)
 ALLOWED_RUNNERS = {"claude", "codex", "gemini"}
+ACTIVE_JOB_STATUSES = ("queued", "running")
 MAX_SETTINGS_BYTES = 10_240  # 10KB
 
 
@@ -260,12 +281,13 @@ def _get_or_create_default_thread(db: Session, room: Room, runner: str) -> Threa
         return thread
 
     # デフォルトThread作成（runnerカラムなし）
+    now = utcnow()
     thread = Thread(
         room_id=room.id,
         name=f"{runner.title()} 会話",
         device_id=room.device_id,
-        created_at=utcnow(),
-        updated_at=utcnow(),
+        created_at=now,
+        updated_at=now,
     )
     db.add(thread)
     db.commit()
@@ -286,15 +308,16 @@ def get_rooms(
     # sort_orderでソート（小さい順）、同じ場合はupdated_atで降順
     rooms = db.query(Room).filter_by(device_id=device_id).order_by(Room.sort_order.asc(), Room.updated_at.desc()).all()
 
-    # v4.3.2: 各Roomの未読スレッド数を取得
+    # v4.3.2: 各Roomの未読スレッド数を取得（Roomごとに数えず GROUP BY 1クエリで）
+    unread_counts = dict(db.execute(
+        select(Thread.room_id, func.count())
+        .where(Thread.device_id == device_id, Thread.has_unread.is_(True))
+        .group_by(Thread.room_id)
+    ).all())
     result = []
     for room in rooms:
         room_dict = room.to_dict()
-        unread_count = db.query(Thread).filter(
-            Thread.room_id == room.id,
-            Thread.has_unread == True,  # noqa: E712
-        ).count()
-        room_dict["unread_count"] = unread_count
+        room_dict["unread_count"] = unread_counts.get(room.id, 0)
         result.append(room_dict)
     return result
 
@@ -313,6 +336,7 @@ def create_room(
     # 新しいRoomは最後に追加（既存の最大sort_order + 1）
     max_order = db.query(Room).filter_by(device_id=req.device_id).count()
 
+    now = utcnow()
     room = Room(
         id=str(uuid.uuid4()),
         name=req.name,
@@ -320,8 +344,8 @@ def create_room(
         icon=req.icon,
         device_id=req.device_id,
         sort_order=max_order,
-        created_at=utcnow(),
-        updated_at=utcnow(),
+        created_at=now,
+        updated_at=now,
     )
     db.add(room)
     db.commit()
@@ -342,10 +366,23 @@ def delete_room(
     if room.device_id != device_id:
         raise HTTPException(status_code=403, detail="Forbidden")
 
+    stdout_paths = [
+        path for (path,) in db.query(Job.stdout_path).filter(
+            Job.room_id == room_id, Job.stdout_path.isnot(None)
+        )
+    ]
+    # 未書き込みのセッションID upsert が削除後に行を復活させないよう、先に破棄する
+    session_manager.discard_pending_session_writes(device_id, room_id)
     db.query(DeviceSession).filter_by(room_id=room_id).delete()
     db.query(Job).filter_by(room_id=room_id).delete()
     db.delete(room)
     db.commit()
+    invalidate_room(room_id)
+    for runner in ALLOWED_RUNNERS:
+        session_manager.invalidate_session_cache(runner, device_id, room_id)
+    # ファイルに逃がした stdout も削除する
+    for path in stdout_paths:
+        Path(path).unlink(missing_ok=True)
     return {"status": "ok"}
 
 
@@ -372,6 +409,11 @@ def update_room(
     room.workspace_path = validated_path
     room.icon = req.icon
     room.updated_at = utcnow()
+    # 実行中ジョブの通知文言に使うRoom名スナップショットも追従させる
+    db.query(Job).filter(
+        Job.room_id == room.id,
+        Job.status.in_(ACTIVE_JOB_STATUSES),
+    ).update({Job.room_name: room.name}, synchronize_session=False)
     db.commit()
     db.refresh(room)
     return room.to_dict()
@@ -447,14 +489,8 @@ async def update_room_settings(
         return {"room_id": room_id, "settings": None}
 
     try:
-        payload = json.loads(body.decode("utf-8"))
-    except UnicodeDecodeError as exc:
-        raise HTTPException(status_code=400, detail="Request body must be UTF-8") from exc
-    except json.JSONDecodeError as exc:
-        raise HTTPException(status_code=400, detail=f"Invalid JSON: {exc.msg}") from exc
-
-    settings_obj = payload if payload is not None else None
-    try:
+        # body はデコードせずそのまま渡す（orjson は bytes を直接読める）
+        settings_obj = parse_settings_json(body)
         sanitized = validate_settings(settings_obj)
     except ValidationError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
@@ -481,8 +517,13 @@ def list_threads(
     if limit > 200:
         raise HTTPException(status_code=400, detail="limit must not exceed 200")
 
-    room = ensure_room_owned(room_id, device_id, db)
-    query = db.query(Thread).filter_by(room_id=room.id)
+    verify_room_ownership_id_only(room_id, device_id, db)
+    # to_dict が参照する未読runnerを1クエリでまとめて読み込む（スレッドごとのSELECTを避ける）
+    query = (
+        db.query(Thread)
+        .options(selectinload(Thread.unread_runners_rel))
+        .filter_by(room_id=room_id)
+    )
 
     # v4.1: ページネーション適用
     threads = (
@@ -509,12 +550,13 @@ def create_thread(
     if not name or len(name) > 100:
         raise HTTPException(status_code=400, detail="Name must be 1-100 characters")
 
+    now = utcnow()
     thread = Thread(
         room_id=room.id,
         name=name,
         device_id=room.device_id,
-        created_at=utcnow(),
-        updated_at=utcnow(),
+        created_at=now,
+        updated_at=now,
     )
     db.add(thread)
     db.commit()
@@ -540,6 +582,11 @@ def update_thread(
         if not name or len(name) > 100:
             raise HTTPException(status_code=400, detail="Name must be 1-100 characters")
         thread.name = name
+        # 実行中ジョブの通知文言に使うスレッド名スナップショットも追従させる
+        db.query(Job).filter(
+            Job.thread_id == thread.id,
+            Job.status.in_(ACTIVE_JOB_STATUSES),
+        ).update({Job.thread_name: name}, synchronize_session=False)
     thread.updated_at = utcnow()
     db.commit()
     db.refresh(thread)
@@ -557,7 +604,7 @@ def delete_thread(
     thread = db.query(Thread).filter_by(id=thread_id).first()
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
-    ensure_room_owned(thread.room_id, device_id, db)
+    verify_room_ownership_id_only(thread.room_id, device_id, db)
     db.delete(thread)
     db.commit()
     LOGGER.info("[NEW] Deleted thread %s", thread_id)
@@ -573,27 +620,20 @@ def mark_thread_read(
     _: None = Depends(verify_api_key),
 ) -> ThreadResponse:
     """Mark a thread as read (clear unread flag for specific runner or all)."""
-    import json
     thread = db.query(Thread).filter_by(id=thread_id).first()
     if not thread:
         raise HTTPException(status_code=404, detail="Thread not found")
-    ensure_room_owned(thread.room_id, device_id, db)
+    verify_room_ownership_id_only(thread.room_id, device_id, db)
 
     # v4.3.1: runner指定時はそのrunnerだけを既読に、なければ全て既読
+    unread_rows = db.query(ThreadUnreadRunner).filter_by(thread_id=thread.id)
     if runner:
-        unread_list = []
-        if thread.unread_runners:
-            try:
-                unread_list = json.loads(thread.unread_runners)
-            except (json.JSONDecodeError, TypeError):
-                unread_list = []
-        if runner in unread_list:
-            unread_list.remove(runner)
-        thread.unread_runners = json.dumps(unread_list)
-        thread.has_unread = len(unread_list) > 0
-        LOGGER.info("[READ] Thread %s marked runner=%s as read (remaining=%s)", thread_id, runner, unread_list)
+        unread_rows.filter_by(runner=runner).delete()
+        remaining = [row.runner for row in unread_rows.all()]
+        thread.has_unread = len(remaining) > 0
+        LOGGER.info("[READ] Thread %s marked runner=%s as read (remaining=%s)", thread_id, runner, remaining)
     else:
-        thread.unread_runners = "[]"
+        unread_rows.delete()
         thread.has_unread = False
         LOGGER.info("[READ] Thread %s marked all as read", thread_id)
 
@@ -801,28 +841,24 @@ def register_device(
         device.device_token = req.device_token
         device.updated_at = utcnow()
     else:
+        now = utcnow()
         device = Device(
             device_id=req.device_id,
             device_token=req.device_token,
-            created_at=utcnow(),
-            updated_at=utcnow(),
+            created_at=now,
+            updated_at=now,
         )
         db.add(device)
     db.commit()
     return {"status": "registered"}
 
 
-@app.post("/jobs", response_model=JobSummary)
-def create_job(
-    req: CreateJobRequest,
-    background_tasks: BackgroundTasks,
-    db: Session = Depends(get_db),
-    _: None = Depends(verify_api_key),
-) -> JobSummary:
-    if req.runner not in ALLOWED_RUNNERS:
-        raise HTTPException(status_code=400, detail="Unsupported runner")
-    if not req.room_id:
-        raise HTTPException(status_code=400, detail="room_id is required")
+def _prepare_job_target(req: CreateJobRequest, db: Session) -> Tuple[Optional[str], Optional[dict], str]:
+    """Resolve the room and thread for a new job and clear the runner's unread flag.
+
+    Runs in a worker thread; returns (workspace_path, room_settings, thread_id).
+    Only plain values are returned so nothing lazy-loads on the event loop.
+    """
     room = ensure_room_owned(req.room_id, req.device_id, db)
 
     if req.thread_id:
@@ -842,33 +878,40 @@ def create_job(
 
     # v4.3.2: ジョブ送信時、送信runnerの未読をクリア（自分で見ているので）
     if thread:
-        unread_list = []
-        if thread.unread_runners:
-            try:
-                unread_list = json.loads(thread.unread_runners)
-            except (json.JSONDecodeError, TypeError):
-                unread_list = []
-        if req.runner in unread_list:
-            unread_list.remove(req.runner)
-            thread.unread_runners = json.dumps(unread_list)
-            thread.has_unread = len(unread_list) > 0
+        unread_rows = db.query(ThreadUnreadRunner).filter_by(thread_id=thread.id)
+        if unread_rows.filter_by(runner=req.runner).delete():
+            thread.has_unread = unread_rows.first() is not None
             db.commit()
             LOGGER.info("[JOB] Cleared unread for runner=%s on thread=%s", req.runner, thread_id)
     try:
         room_settings = json.loads(room.settings) if room.settings else None
     except json.JSONDecodeError:
         room_settings = None
+    return room.workspace_path, room_settings, thread_id
+
+
+@app.post("/jobs", response_model=JobSummary)
+async def create_job(
+    req: CreateJobRequest,
+    db: Session = Depends(get_db),
+    _: None = Depends(verify_api_key),
+) -> JobSummary:
+    if req.runner not in ALLOWED_RUNNERS:
+        raise HTTPException(status_code=400, detail="Unsupported runner")
+    if not req.room_id:
+        raise HTTPException(status_code=400, detail="room_id is required")
+    # 同期 Session の処理はスレッドで実行し、イベントループ（SSE・ジョブタスク）を止めない
+    workspace_path, room_settings, thread_id = await asyncio.to_thread(_prepare_job_target, req, db)
     try:
-        job = job_manager.create_job(
+        job = await job_manager.create_job(
             runner=req.runner,
             input_text=req.input_text,
             device_id=req.device_id,
             room_id=req.room_id,
-            workspace_path=room.workspace_path,
+            workspace_path=workspace_path,
             settings=room_settings,
             thread_id=thread_id,
             notify_token=req.notify_token,
-            background_tasks=background_tasks,
         )
     except ValueError as exc:
         raise HTTPException(status_code=400, detail=str(exc)) from exc
@@ -876,18 +919,18 @@ def create_job(
 
 
 @app.get("/jobs")
-def list_jobs(
+async def list_jobs(
     limit: int = 20,
     status: Optional[str] = None,
     device_id: Optional[str] = None,
     _: None = Depends(verify_api_key),
 ) -> List[dict]:
-    return job_manager.get_jobs(limit=limit, status=status, device_id=device_id)
+    return await job_manager.get_jobs(limit=limit, status=status, device_id=device_id)
 
 
 @app.get("/jobs/{job_id}")
-def get_job(job_id: str, _: None = Depends(verify_api_key)) -> dict:
-    job = job_manager.get_job(job_id)
+async def get_job(job_id: str, _: None = Depends(verify_api_key)) -> dict:
+    job = await job_manager.get_job(job_id)
     if not job:
         raise HTTPException(status_code=404, detail="Job not found")
     return job
@@ -898,8 +941,8 @@ async def stream_job_status(job_id: str, request: Request) -> StreamingResponse:
     """Stream job status updates via Server-Sent Events."""
 
     async def event_generator():
-        # 初期スナップショット送信（高速完了レース対策）
-        job_dict = job_manager.get_job(job_id)
+        # 初期スナップショット送信（高速完了レース対策）。ステータス項目だけなので stdout ファイルは読まない
+        job_dict = await job_manager.get_job(job_id, full_stdout=False)
         if job_dict:
             initial_payload = {
                 "status": job_dict.get("status"),
@@ -952,22 +995,22 @@ def get_messages(
     db: Session = Depends(get_db),
     _: None = Depends(verify_api_key),
 ) -> List[dict]:
-    room = ensure_room_owned(room_id, device_id, db)
+    verify_room_ownership_id_only(room_id, device_id, db)
     query = db.query(Job).filter_by(device_id=device_id, room_id=room_id, runner=runner)
 
     if thread_id:
         thread = db.query(Thread).filter_by(id=thread_id).first()
         if not thread:
             raise HTTPException(status_code=404, detail="Thread not found")
-        if thread.room_id != room.id:
+        if thread.room_id != room_id:
             raise HTTPException(status_code=400, detail="Thread does not belong to room")
         # v4.2: thread.runner チェック削除 - 同一Thread内でrunner自由切替可能
         query = query.filter(Job.thread_id == thread_id)
-        LOGGER.info("[NEW] /messages thread_id=%s room=%s runner=%s", thread_id, room.id, runner)
+        LOGGER.info("[NEW] /messages thread_id=%s room=%s runner=%s", thread_id, room_id, runner)
     else:
         if not settings.threads_compat_mode:
             raise HTTPException(status_code=400, detail="thread_id is required when THREADS_COMPAT_MODE=false")
-        LOGGER.info("[COMPAT] /messages without thread_id room=%s runner=%s", room.id, runner)
+        LOGGER.info("[COMPAT] /messages without thread_id room=%s runner=%s", room_id, runner)
 
     jobs = query.order_by(Job.created_at.desc()).limit(limit).offset(offset).all()
     return [job.to_dict() for job in reversed(jobs)]
@@ -982,7 +1025,9 @@ def delete_session(
     db: Session = Depends(get_db),
     _: None = Depends(verify_api_key),
 ) -> dict:
-    ensure_room_owned(room_id, device_id, db)
+    verify_room_ownership_id_only(room_id, device_id, db)
+    # 未書き込みのセッションID upsert が削除後に行を復活させないよう、先に破棄する
+    session_manager.discard_pending_session_writes(device_id, room_id, runner, thread_id)
 
     if thread_id:
         deleted = (
@@ -1000,6 +1045,8 @@ def delete_session(
         )
 
     db.commit()
+    # 削除したセッションIDをキャッシュから再開しないよう破棄する
+    session_manager.invalidate_session_cache(runner, device_id, room_id, thread_id)
     return {"status": "ok", "deleted": deleted}
 
 
@@ -1010,10 +1057,14 @@ def get_unread_count(
     _: None = Depends(verify_api_key),
 ) -> dict:
     """Get total unread thread count for a device."""
-    count = db.query(Thread).join(Room).filter(
-        Room.device_id == device_id,
-        Thread.has_unread == True,  # noqa: E712
-    ).count()
+    # Thread.device_id は Room.device_id と同じ値なので JOIN せず
+    # idx_threads_device_unread だけで数える（.count() のサブクエリ包みも避ける）
+    count = db.execute(
+        select(func.count()).select_from(Thread).where(
+            Thread.device_id == device_id,
+            Thread.has_unread.is_(True),
+        )
+    ).scalar_one()
     return {"device_id": device_id, "unread_count": count}
 
 
@@ -1170,7 +1221,7 @@ async def regenerate_server_certificate(
     )
 
     try:
-        cert_path, key_path, old_fingerprint, new_fingerprint = regenerate_certificate(
+        cert_path, key_path, old_fingerprint, new_fingerprint = await regenerate_certificate_async(
             hostname=settings.server_hostname,
             san_ips=settings.get_san_ips_list(),
         )
@@ -1187,7 +1238,7 @@ async def regenerate_server_certificate(
         # Note: This updates the advertised fingerprint immediately, but the actual
         # TLS certificate won't change until server restart
         if settings.bonjour_enabled:
-            update_bonjour_fingerprint(new_fingerprint)
+            await update_bonjour_fingerprint_async(new_fingerprint)
             LOGGER.info("Bonjour TXT fingerprint updated to new certificate")
 
         # Broadcast SSE notification with proper SSE format
@@ -1213,6 +1264,64 @@ async def regenerate_server_certificate(
         raise HTTPException(status_code=500, detail=f"Failed to regenerate certificate: {e}")
 
 
+def _is_loopback(host: str) -> bool:
+    """Return True for loopback clients, including IPv4-mapped ones (::ffff:127.0.0.1)."""
+    try:
+        addr = ipaddress.ip_address(host)
+    except ValueError:
+        return False
+    # デュアルスタック時は IPv4 のローカル接続が IPv4-mapped アドレスで届く
+    if isinstance(addr, ipaddress.IPv6Address) and addr.ipv4_mapped is not None:
+        addr = addr.ipv4_mapped
+    return addr.is_loopback
+
+
+@app.post("/internal/cert-reloaded")
+async def certificate_renewed(request: Request) -> dict:
+    """Notify the server that certbot renewed the commercial certificate (localhost only).
+
+    Called by the certbot deploy hook generated by setup_letsencrypt.py just
+    before it restarts this service (launchctl kickstart) to load the renewed
+    certificate. Until the restart it is reported as pending (same as
+    /server/certificate/regenerate) and clients are told via the
+    certificate_changed SSE event.
+    """
+    global _pending_cert_restart, _pending_cert_fingerprint
+
+    from datetime import datetime, timezone
+
+    client_ip = request.client.host if request.client else "unknown"
+    if not _is_loopback(client_ip):
+        raise HTTPException(status_code=403, detail="Forbidden")
+
+    if _current_ssl_mode != "commercial":
+        raise HTTPException(status_code=400, detail="Certificate reload only applies to commercial mode")
+
+    cert_path, _, _ = get_ssl_paths()
+    new_fingerprint = await asyncio.to_thread(get_certificate_fingerprint, cert_path)
+    if new_fingerprint == _current_cert_fingerprint:
+        return {"changed": False, "fingerprint": new_fingerprint}
+
+    LOGGER.warning("[AUDIT] Commercial certificate renewed: %s", cert_path)
+    _pending_cert_restart = True
+    _pending_cert_fingerprint = new_fingerprint
+
+    if settings.bonjour_enabled:
+        await update_bonjour_fingerprint_async(new_fingerprint)
+
+    await sse_manager.broadcast_event(
+        "certificate_changed",
+        {
+            "old_fingerprint": _current_cert_fingerprint,
+            "new_fingerprint": new_fingerprint,
+            "reason": "renewed",
+            "effective_after_restart": True,
+            "timestamp": datetime.now(timezone.utc).isoformat(),
+        },
+    )
+    return {"changed": True, "fingerprint": new_fingerprint}
+
+
 @app.get("/events", dependencies=[Depends(verify_api_key)])
 async def global_events_stream(request: Request) -> StreamingResponse:
     """Global SSE endpoint for certificate and system events.
@@ -1225,7 +1334,7 @@ async def global_events_stream(request: Request) -> StreamingResponse:
     Requires API Key authentication.
     """
     async def event_generator():
-        queue: asyncio.Queue = asyncio.Queue()
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAXSIZE)
         sse_manager._global_subscribers.add(queue)
         LOGGER.info("[SSE-GLOBAL] New subscriber connected")
 
@@ -1239,6 +1348,10 @@ async def global_events_stream(request: Request) -> StreamingResponse:
                     payload = await asyncio.wait_for(queue.get(), timeout=30.0)
                     if payload is None:
                         break
+                    if isinstance(payload, bytes):
+                        # broadcast_event で整形済みのフレーム
+                        yield payload
+                        continue
 
                     # Send with proper SSE format including event name
                     event_name = payload.get("event", "message")
@@ -1361,7 +1474,8 @@ async def list_invitations(
 ) -> List[dict]:
     """List invitation codes created by this device."""
     invitations = db.query(InvitationCode).filter_by(created_by_device_id=device_id).all()
-    return [inv.to_dict() for inv in invitations]
+    now = utcnow()  # 全件の有効判定で同じ時刻を使う
+    return [inv.to_dict(now) for inv in invitations]
 
 
 @app.post("/subdomain/register")
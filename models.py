@@ -3,6 +3,8 @@ from __future__ import annotations
 
 import uuid
 from datetime import datetime, timezone
+from pathlib import Path
+from typing import Optional
 
 from sqlalchemy import (
     Boolean,
@@ -20,9 +22,13 @@ from sqlalchemy.orm import relationship
 from db import Base
 
 
+# datetime.now に渡すたびに属性参照しないよう束縛しておく
+_UTC = timezone.utc
+
+
 def utcnow() -> datetime:
     """Return current UTC time as timezone-aware datetime."""
-    return datetime.now(timezone.utc)
+    return datetime.now(_UTC)
 
 
 class Room(Base):
@@ -41,6 +47,10 @@ class Room(Base):
     # Relationships
     threads = relationship("Thread", back_populates="room", cascade="all, delete-orphan")
 
+    __table_args__ = (
+        Index("idx_rooms_id_device", "id", "device_id"),  # 所有権チェック用カバリングインデックス
+    )
+
     def to_dict(self) -> dict:
         return {
             "id": self.id,
@@ -64,8 +74,6 @@ class Thread(Base):
     device_id = Column(String(100), nullable=False)
     # v4.3: 未読フラグ - 推論完了時にtrue、スレッド表示時にfalse
     has_unread = Column(Boolean, nullable=False, default=False)
-    # v4.3.1: runner別未読フラグ（JSON配列: ["claude", "codex"]など）
-    unread_runners = Column(Text, nullable=True, default="[]")
     created_at = Column(DateTime, nullable=False, default=utcnow)
     updated_at = Column(DateTime, nullable=False, default=utcnow, onupdate=utcnow, index=True)
 
@@ -73,20 +81,23 @@ class Thread(Base):
     room = relationship("Room", back_populates="threads")
     jobs = relationship("Job", back_populates="thread")  # v4.1: Thread削除時にJobsはCASCADE削除せず、thread_id=NULLに設定
     sessions = relationship("DeviceSession", back_populates="thread", cascade="all, delete-orphan")
+    # v4.3.1: runner別未読フラグ（thread_unread_runners テーブル）
+    unread_runners_rel = relationship(
+        "ThreadUnreadRunner",
+        back_populates="thread",
+        cascade="all, delete-orphan",
+        passive_deletes=True,
+        order_by="ThreadUnreadRunner.runner",
+    )
 
     __table_args__ = (
         # v4.2: idx_threads_room_runner削除 - runnerカラムがなくなったため
         Index("idx_threads_updated_at", "updated_at"),
+        Index("idx_threads_device_unread", "device_id", "has_unread"),  # バッジ数集計用
     )
 
     def to_dict(self) -> dict:
-        import json
-        unread_list = []
-        if self.unread_runners:
-            try:
-                unread_list = json.loads(self.unread_runners)
-            except (json.JSONDecodeError, TypeError):
-                unread_list = []
+        unread_list = [row.runner for row in self.unread_runners_rel]
         return {
             "id": self.id,
             "room_id": self.room_id,
@@ -102,6 +113,20 @@ class Thread(Base):
         }
 
 
+class ThreadUnreadRunner(Base):
+    """スレッドのrunner別未読フラグ。
+
+    旧 threads.unread_runners（JSON配列）を正規化したもの。1行 = 1 runner の未読。
+    """
+    __tablename__ = "thread_unread_runners"
+
+    thread_id = Column(String(36), ForeignKey("threads.id", ondelete="CASCADE"), primary_key=True)
+    runner = Column(String(20), primary_key=True)
+
+    # Relationships
+    thread = relationship("Thread", back_populates="unread_runners_rel")
+
+
 class DeviceSession(Base):
     __tablename__ = "device_sessions"
     __table_args__ = (
@@ -112,7 +137,7 @@ class DeviceSession(Base):
             "thread_id",
             name="uq_device_room_runner_thread",
         ),
-        Index("idx_device_room_runner_thread", "device_id", "room_id", "runner", "thread_id"),
+        # 検索・upsert とも上の UNIQUE 制約の複合インデックスで賄う
     )
 
     id = Column(Integer, primary_key=True, autoincrement=True)
@@ -149,11 +174,15 @@ class Job(Base):
     thread_id = Column(String(36), ForeignKey("threads.id", ondelete="SET NULL"), nullable=True)  # v4.1: Thread削除時にNULL設定
     status = Column(String(20), nullable=False)
     exit_code = Column(Integer)
-    stdout = Column(Text)
+    stdout = Column(Text)  # stdout_path がある場合は先頭のプレビューのみ
+    stdout_path = Column(String(255))  # 大きな stdout の保存先ファイル
     stderr = Column(Text)
     started_at = Column(DateTime)
     finished_at = Column(DateTime)
     notify_token = Column(String(255))
+    # 通知文言用のRoom名/スレッド名スナップショット（作成時に保存、リネーム時に追従）
+    room_name = Column(String(100))
+    thread_name = Column(String(100))
     created_at = Column(DateTime, nullable=False, default=utcnow)
 
     # Relationships
@@ -164,12 +193,22 @@ class Job(Base):
         Index("idx_jobs_room_thread", "room_id", "thread_id"),
         Index("idx_jobs_status", "status"),  # v4.1: ステータスフィルタ用
         Index("idx_jobs_created_at", "created_at"),  # v4.1: 作成日時ソート用
-        Index("idx_jobs_device_id", "device_id"),  # v4.1: デバイス別フィルタ用
-        Index("idx_jobs_room_id", "room_id"),  # v4.1: Room別フィルタ用
+        # device_id 単独 / room_id 単独の検索は idx_jobs_device_room / idx_jobs_room_thread の先頭列で賄う
         Index("idx_jobs_device_room", "device_id", "room_id"),  # v4.1: デバイス+Room複合検索用
     )
 
-    def to_dict(self) -> dict:
+    def read_stdout(self) -> Optional[str]:
+        """Return the full stdout, reading it from stdout_path when offloaded."""
+        if not self.stdout_path:
+            return self.stdout
+        try:
+            return Path(self.stdout_path).read_text(encoding="utf-8")
+        except OSError:
+            # ファイルが消えていてもプレビューは返せる
+            return self.stdout
+
+    def to_dict(self, full_stdout: bool = True) -> dict:
+        """Serialize the job; full_stdout=False returns only the stored preview."""
         return {
             "id": self.id,
             "runner": self.runner,
@@ -179,7 +218,7 @@ class Job(Base):
             "thread_id": self.thread_id,
             "status": self.status,
             "exit_code": self.exit_code,
-            "stdout": self.stdout,
+            "stdout": self.read_stdout() if full_stdout else self.stdout,
             "stderr": self.stderr,
             "created_at": self.created_at.isoformat() if self.created_at else None,
             "started_at": self.started_at.isoformat() if self.started_at else None,
@@ -203,21 +242,20 @@ class InvitationCode(Base):
     expires_at = Column(DateTime, nullable=False)  # 有効期限
     created_at = Column(DateTime, nullable=False, default=utcnow)
 
-    def is_valid(self) -> bool:
-        """招待コードが有効かどうか。"""
+    def is_valid(self, now: Optional[datetime] = None) -> bool:
+        """招待コードが有効かどうか。
+
+        複数件を判定する場合は呼び出し側で now を一度だけ取得して渡す。
+        """
         if self.used_by_device_id is not None:
             return False
-        # timezone-awareとnaiveの比較を安全に行う
-        now = utcnow()
+        # SQLite は tzinfo を保存しないため、読み出した naive 値は UTC として扱う
         expires = self.expires_at
         if expires.tzinfo is None:
-            from datetime import timezone
-            expires = expires.replace(tzinfo=timezone.utc)
-        if expires < now:
-            return False
-        return True
+            expires = expires.replace(tzinfo=_UTC)
+        return expires >= (now or utcnow())
 
-    def to_dict(self) -> dict:
+    def to_dict(self, now: Optional[datetime] = None) -> dict:
         return {
             "id": self.id,
             "code": self.code,
@@ -226,7 +264,7 @@ class InvitationCode(Base):
             "used_at": self.used_at.isoformat() if self.used_at else None,
             "expires_at": self.expires_at.isoformat() if self.expires_at else None,
             "created_at": self.created_at.isoformat() if self.created_at else None,
-            "is_valid": self.is_valid(),
+            "is_valid": self.is_valid(now),
         }
 
 
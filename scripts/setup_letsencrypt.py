@@ -18,14 +18,20 @@
 """
 import argparse
 import os
-import re
+import shutil
+import socket
 import subprocess
 import sys
+from datetime import datetime, timedelta, timezone
 from pathlib import Path
 
 
 DOMAIN = "remoteprompt.net"
 CERT_BASE_DIR = Path("./certs")
+# 有効期限までこれ以上残っていれば certbot を呼ばずに既存の証明書を使う
+RENEW_BEFORE = timedelta(days=30)
+# サーバーを launchd で常駐させている場合のジョブ名（更新後にこのジョブだけ再起動する）
+DEFAULT_SERVER_LABEL = "com.remoteprompt.server"
 
 
 def run_command(cmd: list, check: bool = True) -> subprocess.CompletedProcess:
@@ -36,8 +42,7 @@ def run_command(cmd: list, check: bool = True) -> subprocess.CompletedProcess:
 
 def check_certbot_installed() -> bool:
     """certbotがインストールされているか確認"""
-    result = subprocess.run(["which", "certbot"], capture_output=True)
-    return result.returncode == 0
+    return shutil.which("certbot") is not None
 
 
 def install_certbot():
@@ -55,26 +60,53 @@ def install_certbot():
 def check_dns_resolution(full_domain: str) -> bool:
     """DNSが正しく解決されるか確認"""
     print(f"DNS解決を確認しています: {full_domain}")
-    result = subprocess.run(["dig", "+short", full_domain], capture_output=True, text=True)
-
-    if result.returncode != 0 or not result.stdout.strip():
-        print(f"エラー: {full_domain} のDNS解決に失敗しました。")
+    try:
+        infos = socket.getaddrinfo(full_domain, None, type=socket.SOCK_STREAM)
+    except socket.gaierror as exc:
+        print(f"エラー: {full_domain} のDNS解決に失敗しました。（{exc.strerror}）")
         print("管理者にDNS登録を依頼してください。")
         return False
 
-    resolved_ip = result.stdout.strip().split('\n')[0]
+    resolved_ip = infos[0][4][0]
     print(f"  → {resolved_ip}")
     return True
 
 
 def check_port_80_available() -> bool:
     """ポート80が使用可能か確認"""
-    result = subprocess.run(["lsof", "-i", ":80"], capture_output=True, text=True)
-    if result.stdout.strip():
-        print("警告: ポート80が使用中です。")
-        print(result.stdout)
+    sock = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    try:
+        sock.bind(("", 80))
+    except PermissionError:
+        # 非rootでは確認できない（certbot は sudo で実行するので続行）
+        return True
+    except OSError as exc:
+        print(f"警告: ポート80が使用中です。（{exc.strerror}）")
         print("証明書発行中は一時的にポート80を使用します。")
         return False
+    finally:
+        sock.close()
+    return True
+
+
+def has_valid_certificate(cert_path: Path) -> bool:
+    """発行済みの証明書が十分な有効期限を残しているか確認"""
+    cert_file = cert_path / "cert.pem"
+    if not cert_file.exists():
+        return False
+    try:
+        from cryptography import x509  # pylint: disable=import-outside-toplevel
+    except ImportError:
+        return False
+    try:
+        cert = x509.load_pem_x509_certificate(cert_file.read_bytes())
+    except (OSError, ValueError):
+        return False
+
+    remaining = cert.not_valid_after_utc - datetime.now(timezone.utc)
+    if remaining <= RENEW_BEFORE:
+        return False
+    print(f"有効な証明書が既に存在します: {cert_path}（残り {remaining.days} 日）")
     return True
 
 
@@ -84,6 +116,11 @@ def issue_certificate(subdomain: str) -> Path:
     cert_dir = CERT_BASE_DIR / DOMAIN / "config"
     cert_dir.mkdir(parents=True, exist_ok=True)
 
+    # 既存の証明書が有効なら DNS 確認も certbot も不要
+    cert_path = cert_dir / "live" / full_domain
+    if has_valid_certificate(cert_path):
+        return cert_path
+
     # DNS解決確認
     if not check_dns_resolution(full_domain):
         sys.exit(1)
@@ -119,7 +156,6 @@ def issue_certificate(subdomain: str) -> Path:
         print("  3. DNSがまだ伝播していない（数分待ってから再試行）")
         sys.exit(1)
 
-    cert_path = cert_dir / "live" / full_domain
     print(f"証明書が発行されました: {cert_path}")
 
     # 証明書ファイルの所有権を現在のユーザーに変更
@@ -130,32 +166,66 @@ def issue_certificate(subdomain: str) -> Path:
     return cert_path
 
 
-def setup_auto_renewal(subdomain: str):
+def setup_auto_renewal(subdomain: str, server_label: str = DEFAULT_SERVER_LABEL):
     """自動更新のlaunchdジョブを設定（macOS）"""
     full_domain = f"{subdomain}.{DOMAIN}"
     cert_dir = CERT_BASE_DIR / DOMAIN / "config"
+    server_port = os.environ.get("SERVER_PORT", "8443")
+    current_user = os.environ.get("USER", "root")
+    service_target = f"gui/{os.getuid()}/{server_label}"
 
     # ログディレクトリを作成
     (cert_dir / "logs").mkdir(parents=True, exist_ok=True)
 
+    # certbot の deploy-hook（証明書が実際に更新されたときだけ root で実行される）
+    hook_path = Path(__file__).parent / "letsencrypt-deploy-hook.sh"
+    hook_content = f"""#!/bin/bash
+# Let's Encrypt証明書の更新後処理
+
+CERT_DIR="{cert_dir.absolute()}"
+
+# 証明書ファイルの所有権を戻す（サーバーは一般ユーザーで読む）
+chown -R {current_user} "$CERT_DIR"
+
+# 稼働中のサーバーへ通知し、クライアントに certificate_changed を配信させる
+curl -fsk -m 10 -X POST https://127.0.0.1:{server_port}/internal/cert-reloaded >/dev/null || true
+
+# 更新した証明書を反映するため、このサーバーだけを再起動する
+if launchctl print "{service_target}" >/dev/null 2>&1; then
+    launchctl kickstart -k "{service_target}"
+    echo "[$(date)] 証明書を更新しサーバーを再起動しました" >> "$CERT_DIR/logs/renewal.log"
+else
+    # launchd 管理外（python main.py を手動起動など）では安全に再起動できないので記録だけ残す
+    echo "[$(date)] 証明書を更新しました。{service_target} が launchd に無いため、サーバーを手動で再起動してください" >> "$CERT_DIR/logs/renewal.log"
+fi
+"""
+    hook_path.write_text(hook_content)
+    hook_path.chmod(0o755)
+
     # 更新スクリプトを作成
     script_path = Path(__file__).parent / "renew-letsencrypt.sh"
     script_content = f"""#!/bin/bash
 # Let's Encrypt証明書自動更新スクリプト
 
 CERT_DIR="{cert_dir.absolute()}"
+CERT_FILE="$CERT_DIR/live/{full_domain}/cert.pem"
+
+# 有効期限まで十分残っていれば certbot（起動だけで数秒かかる）を呼ばずに終了
+if [ -f "$CERT_FILE" ] && openssl x509 -checkend {int(RENEW_BEFORE.total_seconds())} -noout -in "$CERT_FILE" >/dev/null 2>&1; then
+    echo "[$(date)] 証明書更新不要" >> "$CERT_DIR/logs/renewal.log"
+    exit 0
+fi
 
-# 証明書を更新（HTTPチャレンジ）
+# 証明書を更新（HTTPチャレンジ）。更新されたときだけ deploy-hook で
+# 所有権を戻し、サーバーへ通知して再起動する
 sudo certbot renew \\
     --standalone \\
     --preferred-challenges http \\
     --config-dir "$CERT_DIR" \\
     --work-dir "$CERT_DIR/work" \\
     --logs-dir "$CERT_DIR/logs" \\
-    --quiet
-
-# サーバーを再起動（証明書を反映）
-pkill -HUP -f "uvicorn main:app" 2>/dev/null || true
+    --quiet \\
+    --deploy-hook "{hook_path.absolute()}"
 
 echo "[$(date)] 証明書更新チェック完了" >> "$CERT_DIR/logs/renewal.log"
 """
@@ -197,6 +267,7 @@ echo "[$(date)] 証明書更新チェック完了" >> "$CERT_DIR/logs/renewal.lo
 
     print(f"自動更新を設定しました（毎日3:00 AM）")
     print(f"  スクリプト: {script_path}")
+    print(f"  deploy-hook: {hook_path}（更新時に {service_target} を再起動）")
     print(f"  plist: {plist_path}")
 
 
@@ -209,30 +280,26 @@ def update_env_file(subdomain: str, cert_path: Path):
         print(f"警告: {env_path} が見つかりません。手動で設定してください。")
         return
 
-    content = env_path.read_text()
-
-    # SERVER_HOSTNAMEを更新
-    if "SERVER_HOSTNAME=" in content:
-        content = re.sub(r'SERVER_HOSTNAME=.*', f'SERVER_HOSTNAME={full_domain}', content)
-    else:
-        content += f"\nSERVER_HOSTNAME={full_domain}\n"
-
-    # SSL_MODEを更新
-    if "SSL_MODE=" in content:
-        content = re.sub(r'SSL_MODE=.*', 'SSL_MODE=commercial', content)
-    else:
-        content += "SSL_MODE=commercial\n"
-
-    # 証明書パスを更新
-    cert_fullchain = cert_path / "fullchain.pem"
-    cert_privkey = cert_path / "privkey.pem"
-
-    if "COMMERCIAL_CERT_PATH=" in content:
-        content = re.sub(r'COMMERCIAL_CERT_PATH=.*', f'COMMERCIAL_CERT_PATH={cert_fullchain}', content)
-        content = re.sub(r'COMMERCIAL_KEY_PATH=.*', f'COMMERCIAL_KEY_PATH={cert_privkey}', content)
-    else:
-        content += f"COMMERCIAL_CERT_PATH={cert_fullchain}\n"
-        content += f"COMMERCIAL_KEY_PATH={cert_privkey}\n"
+    updates = {
+        "SERVER_HOSTNAME": full_domain,
+        "SSL_MODE": "commercial",
+        "COMMERCIAL_CERT_PATH": str(cert_path / "fullchain.pem"),
+        "COMMERCIAL_KEY_PATH": str(cert_path / "privkey.pem"),
+    }
+
+    # 一度だけ行に分解してキー -> 行番号の表を作り、該当行だけ書き換える（コメントや順序は保持）
+    lines = env_path.read_text().splitlines()
+    key_lines = {
+        line.split("=", 1)[0].strip(): i
+        for i, line in enumerate(lines)
+        if "=" in line and not line.lstrip().startswith("#")
+    }
+    for key, value in updates.items():
+        if key in key_lines:
+            lines[key_lines[key]] = f"{key}={value}"
+        else:
+            lines.append(f"{key}={value}")
+    content = "\n".join(lines) + "\n"
 
     env_path.write_text(content)
     print(f".envファイルを更新しました: {env_path}")
@@ -242,6 +309,11 @@ def main():
     parser = argparse.ArgumentParser(description="Let's Encrypt証明書発行・自動更新セットアップ（HTTPチャレンジ）")
     parser.add_argument("subdomain", help="管理者から発行されたサブドメイン名（例: abc12345）")
     parser.add_argument("--skip-install", action="store_true", help="certbotのインストールをスキップ")
+    parser.add_argument(
+        "--server-label",
+        default=DEFAULT_SERVER_LABEL,
+        help=f"サーバーを常駐させている launchd ジョブ名（証明書更新後に再起動する。既定: {DEFAULT_SERVER_LABEL}）",
+    )
     args = parser.parse_args()
 
     subdomain = args.subdomain.strip()
@@ -266,7 +338,7 @@ def main():
     cert_path = issue_certificate(subdomain)
 
     # 自動更新設定
-    setup_auto_renewal(subdomain)
+    setup_auto_renewal(subdomain, args.server_label)
 
     # .env更新
     update_env_file(subdomain, cert_path)
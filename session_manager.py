@@ -1,72 +1,367 @@
 """Session management layer for Claude Code and Codex CLIs."""
 from __future__ import annotations
 
+import asyncio
+import codecs
 import logging
 import os
 import re
-import subprocess
+import signal
+import threading
 import uuid
+from collections import OrderedDict
 from pathlib import Path
-from typing import Dict, Optional
+from typing import Awaitable, Callable, ClassVar, Dict, List, Optional, Tuple
 
-from database import SessionLocal
-from models import DeviceSession
+from sqlalchemy import bindparam, select
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+
+from database import engine
+from models import DeviceSession, utcnow
 from utils.cli_builder import build_claude_command, build_codex_command, build_gemini_command
 
 LOGGER = logging.getLogger(__name__)
 CODEx_SESSION_PATTERN = re.compile(r"session id:\s+([a-f0-9\-]{36})", re.IGNORECASE)
 # Default to project root (parent of remote-job-server directory)
 DEFAULT_TRUSTED_DIR = Path(os.getenv("CLAUDE_TRUSTED_DIR", Path(__file__).parent.parent)).resolve()
+CLI_TIMEOUT_SECONDS = 1800  # 30 minutes (extended from 5 min for long Codex jobs)
+# パイプから一度に読む量。改行のない長い出力もこの単位で転送する
+_READ_CHUNK = 64 * 1024
+# タイムアウト時、SIGTERM 後に SIGKILL するまでの猶予
+_KILL_GRACE_SECONDS = 5.0
+# セッションID書き込みを1トランザクションにまとめる最大件数
+SESSION_WRITE_BATCH_MAX = 32
+
+# on_output(stream_name, text): called for each line ("stdout" / "stderr") as the CLI emits it
+OutputCallback = Callable[[str, str], Awaitable[None]]
+
+_CacheKey = Tuple[str, str, str]
+
+
+async def _pump_stream(
+    stream: asyncio.StreamReader,
+    name: str,
+    sink: List[str],
+    on_output: Optional[OutputCallback],
+) -> None:
+    """Read a CLI pipe to EOF, collecting text into sink and forwarding lines to on_output."""
+    decoder = codecs.getincrementaldecoder("utf-8")(errors="replace")
+    pending = ""
+    while True:
+        data = await stream.read(_READ_CHUNK)
+        text = decoder.decode(data, final=not data)
+        if text:
+            sink.append(text)
+        if on_output is not None:
+            pending += text
+            if "\n" in pending:
+                *lines, pending = pending.split("\n")
+                for line in lines:
+                    await on_output(name, line + "\n")
+            if pending and (not data or len(pending) >= _READ_CHUNK):
+                # EOF か改行のない長い行は、そのまま送る
+                await on_output(name, pending)
+                pending = ""
+        if not data:
+            return
+
+
+async def _terminate_process_group(proc: asyncio.subprocess.Process) -> None:
+    """SIGTERM the CLI's process group, then SIGKILL whatever survives the grace period."""
+    try:
+        os.killpg(proc.pid, signal.SIGTERM)
+    except ProcessLookupError:
+        return
+    try:
+        await asyncio.wait_for(proc.wait(), timeout=_KILL_GRACE_SECONDS)
+    except asyncio.TimeoutError:
+        pass
+    # 親が終了していても孫プロセスがグループに残っていることがある
+    try:
+        os.killpg(proc.pid, signal.SIGKILL)
+    except ProcessLookupError:
+        pass
+    await proc.wait()
+
+
+class _SessionIdCache:
+    """Process-local LRU of (device_id, room_id, thread_id) -> session_id.
+
+    Misses (None) are cached too. Entries are refreshed on save and must be
+    invalidated by anything else that deletes DeviceSession rows.
+    """
+
+    MISS = object()
+
+    def __init__(self, maxsize: int = 4096) -> None:
+        self._maxsize = maxsize
+        self._data: "OrderedDict[_CacheKey, Optional[str]]" = OrderedDict()
+        # DB lookups run in worker threads (asyncio.to_thread)
+        self._lock = threading.Lock()
+
+    def get(self, key: _CacheKey) -> object:
+        with self._lock:
+            value = self._data.get(key, self.MISS)
+            if value is not self.MISS:
+                self._data.move_to_end(key)
+            return value
+
+    def set(self, key: _CacheKey, session_id: Optional[str]) -> None:
+        with self._lock:
+            self._data[key] = session_id
+            self._data.move_to_end(key)
+            if len(self._data) > self._maxsize:
+                self._data.popitem(last=False)
+
+    def invalidate(self, device_id: str, room_id: str, thread_id: Optional[str] = None) -> None:
+        """Drop cached entries for a room (or a single thread when thread_id is given)."""
+        with self._lock:
+            if thread_id is not None:
+                self._data.pop((device_id, room_id, thread_id), None)
+                return
+            for key in [k for k in self._data if k[0] == device_id and k[1] == room_id]:
+                del self._data[key]
+
+
+# 全runner共通の検索文を一度だけ組み立て、値は bindparam で渡す
+# （同一の文オブジェクトなので SQLAlchemy のコンパイル済みキャッシュに毎回ヒットする）
+_SELECT_SESSION_ID = select(DeviceSession.session_id).where(
+    DeviceSession.device_id == bindparam("device_id"),
+    DeviceSession.room_id == bindparam("room_id"),
+    DeviceSession.runner == bindparam("runner"),
+    DeviceSession.thread_id == bindparam("thread_id"),
+)
+
+
+def _fetch_session_id(runner: str, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
+    """Look up the persisted session ID for a runner/thread."""
+    # Core 文だけなので ORM Session を作らず接続で直接実行する
+    with engine.connect() as conn:
+        return conn.execute(
+            _SELECT_SESSION_ID,
+            {"device_id": device_id, "room_id": room_id, "runner": runner, "thread_id": thread_id},
+        ).scalar()
+
+
+# (runner, device_id, room_id, thread_id, session_id)
+_SessionIdRow = Tuple[str, str, str, str, str]
+
+# executemany で使い回す upsert 文（uq_device_room_runner_thread に衝突したら更新）
+_insert_session = sqlite_insert(DeviceSession)
+_UPSERT_SESSION_ID = _insert_session.on_conflict_do_update(
+    index_elements=["device_id", "room_id", "runner", "thread_id"],
+    set_={"session_id": _insert_session.excluded.session_id, "updated_at": _insert_session.excluded.updated_at},
+)
+
+
+def _upsert_session_ids(rows: List[_SessionIdRow]) -> None:
+    """Insert or update a batch of session IDs in one transaction."""
+    now = utcnow()
+    params = [
+        {
+            "runner": runner,
+            "device_id": device_id,
+            "room_id": room_id,
+            "thread_id": thread_id,
+            "session_id": session_id,
+            "created_at": now,
+            "updated_at": now,
+        }
+        for runner, device_id, room_id, thread_id, session_id in rows
+    ]
+    with engine.begin() as conn:
+        conn.execute(_UPSERT_SESSION_ID, params)
 
 
-class ClaudeSessionManager:
-    """Manage claude --print sessions with DB-backed persistence."""
+class _SessionIdWriter:
+    """Persist session IDs from a single background task, batching pending writes.
 
-    def __init__(self, trusted_directory: Path | str = DEFAULT_TRUSTED_DIR) -> None:
-        self.trusted_directory = Path(trusted_directory)
+    Jobs only enqueue, so the DB commit stays off their completion path;
+    callers keep the session cache current themselves. Pending writes are
+    keyed by (runner, device_id, room_id, thread_id) so a newer session ID
+    supersedes a queued one, and discard() can drop them before a DELETE.
+    aclose() flushes what is still pending.
+    """
+
+    def __init__(self) -> None:
+        # _pending は API のスレッドプールからも触る（discard）ので threading.Lock で守る
+        self._lock = threading.Lock()
+        self._pending: "OrderedDict[Tuple[str, str, str, str], str]" = OrderedDict()
+        # バッチの取り出しから commit までを保持する。discard はこれを待つので、
+        # 書き込み中の行も呼び出し側の DELETE より前に確定する
+        self._write_lock = threading.Lock()
+        self._wakeup: Optional[asyncio.Event] = None
+        self._task: Optional[asyncio.Task] = None
+
+    def submit(self, row: _SessionIdRow) -> None:
+        runner, device_id, room_id, thread_id, session_id = row
+        with self._lock:
+            self._pending[(runner, device_id, room_id, thread_id)] = session_id
+        if self._task is None or self._task.done():
+            # イベントループ上で初めて呼ばれたときに起動する
+            self._wakeup = asyncio.Event()
+            self._task = asyncio.create_task(self._run())
+        self._wakeup.set()
+
+    def discard(
+        self,
+        device_id: str,
+        room_id: str,
+        runner: Optional[str] = None,
+        thread_id: Optional[str] = None,
+    ) -> None:
+        """Drop pending writes for a room (optionally one runner/thread).
+
+        Call before deleting DeviceSession rows so a queued upsert cannot
+        re-insert them. Blocks until a batch being written has committed.
+        """
+        with self._write_lock, self._lock:
+            stale = [
+                key
+                for key in self._pending
+                if key[1] == device_id
+                and key[2] == room_id
+                and (runner is None or key[0] == runner)
+                and (thread_id is None or key[3] == thread_id)
+            ]
+            for key in stale:
+                del self._pending[key]
+
+    def _write_batch(self) -> bool:
+        """Write up to SESSION_WRITE_BATCH_MAX pending rows (worker thread); False when none were left."""
+        with self._write_lock:
+            with self._lock:
+                batch: List[_SessionIdRow] = []
+                while self._pending and len(batch) < SESSION_WRITE_BATCH_MAX:
+                    key, session_id = self._pending.popitem(last=False)
+                    batch.append((*key, session_id))
+            if not batch:
+                return False
+            try:
+                _upsert_session_ids(batch)
+            except Exception:  # pylint: disable=broad-except
+                LOGGER.exception("Failed to persist %d session id(s)", len(batch))
+            return True
+
+    async def _run(self) -> None:
+        wakeup = self._wakeup
+        while True:
+            await wakeup.wait()
+            wakeup.clear()
+            while await asyncio.to_thread(self._write_batch):
+                pass
+
+    async def aclose(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        # 残りを書き切る（書き込み中のバッチがあれば _write_lock で待つ）
+        while await asyncio.to_thread(self._write_batch):
+            pass
+
+
+class _BaseSessionManager:
+    """DB-backed session persistence shared by all runners; subclasses set RUNNER."""
+
+    RUNNER: ClassVar[str]
+
+    def __init__(self, session_writer: Optional[_SessionIdWriter] = None) -> None:
+        self.session_cache = _SessionIdCache()
+        self.session_writer = session_writer or _SessionIdWriter()
 
     # --- DB helpers -----------------------------------------------------
     def _get_session_id_from_db(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="claude", thread_id=thread_id)
-                .first()
-            )
-            return record.session_id if record else None
-        finally:
-            db.close()
-
-    def _save_session_id_to_db(self, device_id: str, room_id: str, thread_id: str, session_id: str) -> None:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="claude", thread_id=thread_id)
-                .first()
-            )
-            if record:
-                record.session_id = session_id
-            else:
-                record = DeviceSession(
-                    device_id=device_id,
-                    room_id=room_id,
-                    runner="claude",
-                    thread_id=thread_id,
-                    session_id=session_id,
-                )
-                db.add(record)
-            db.commit()
-        finally:
-            db.close()
+        key = (device_id, room_id, thread_id)
+        cached = self.session_cache.get(key)
+        if cached is not _SessionIdCache.MISS:
+            return cached
+        session_id = _fetch_session_id(self.RUNNER, device_id, room_id, thread_id)
+        self.session_cache.set(key, session_id)
+        return session_id
+
+    def _save_session_id(self, device_id: str, room_id: str, thread_id: str, session_id: str) -> None:
+        # キャッシュを先に更新するので、DB 書き込みを待たずに次のジョブから再開できる
+        self.session_cache.set((device_id, room_id, thread_id), session_id)
+        self.session_writer.submit((self.RUNNER, device_id, room_id, thread_id, session_id))
 
     def get_session_id(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
         """Return the persisted session ID, if any."""
         return self._get_session_id_from_db(device_id, room_id, thread_id)
 
     # --- Execution ------------------------------------------------------
-    def execute_job(
+    @staticmethod
+    async def _run_cli(
+        cmd: list,
+        input_text: Optional[str],
+        cwd: Optional[Path],
+        on_output: Optional[OutputCallback] = None,
+    ) -> Tuple[int, str, str]:
+        """Run a CLI without blocking the event loop; returns (returncode, stdout, stderr).
+
+        stdout/stderr are read incrementally and each line is passed to
+        on_output as it arrives. Raises asyncio.TimeoutError after
+        CLI_TIMEOUT_SECONDS; the child is killed on timeout or cancellation.
+        """
+        proc = await asyncio.create_subprocess_exec(
+            *cmd,
+            stdin=asyncio.subprocess.PIPE if input_text is not None else None,
+            stdout=asyncio.subprocess.PIPE,
+            stderr=asyncio.subprocess.PIPE,
+            cwd=cwd,
+            # 新しいプロセスグループで起動し、CLI が生んだ node / rg なども一緒に止められるようにする
+            start_new_session=True,
+        )
+        stdout_parts: List[str] = []
+        stderr_parts: List[str] = []
+
+        async def _feed_stdin() -> None:
+            if input_text is None:
+                return
+            try:
+                proc.stdin.write(input_text.encode("utf-8"))
+                await proc.stdin.drain()
+            except (BrokenPipeError, ConnectionResetError):
+                pass  # CLI が入力を読まずに終了した
+            finally:
+                proc.stdin.close()
+
+        async def _communicate() -> int:
+            # stdin への書き込みとパイプの読み出しを並行させ、どちらかが詰まっても進むようにする
+            await asyncio.gather(
+                _feed_stdin(),
+                _pump_stream(proc.stdout, "stdout", stdout_parts, on_output),
+                _pump_stream(proc.stderr, "stderr", stderr_parts, on_output),
+            )
+            return await proc.wait()
+
+        try:
+            returncode = await asyncio.wait_for(_communicate(), timeout=CLI_TIMEOUT_SECONDS)
+        except BaseException:
+            # タイムアウト・キャンセル時に CLI とその子プロセスを残さない
+            await _terminate_process_group(proc)
+            raise
+        return returncode, "".join(stdout_parts), "".join(stderr_parts)
+
+
+class ClaudeSessionManager(_BaseSessionManager):
+    """Manage claude --print sessions with DB-backed persistence."""
+
+    RUNNER = "claude"
+
+    def __init__(
+        self,
+        trusted_directory: Path | str = DEFAULT_TRUSTED_DIR,
+        session_writer: Optional[_SessionIdWriter] = None,
+    ) -> None:
+        super().__init__(session_writer)
+        self.trusted_directory = Path(trusted_directory)
+
+    # --- Execution ------------------------------------------------------
+    async def execute_job(
         self,
         prompt: str,
         device_id: str,
@@ -75,6 +370,7 @@ class ClaudeSessionManager:
         continue_session: bool = True,
         settings: Optional[dict] = None,
         thread_id: Optional[str] = None,
+        on_output: Optional[OutputCallback] = None,
     ) -> Dict[str, Optional[str]]:
         if not thread_id:
             raise ValueError("thread_id is required for session management")
@@ -82,7 +378,7 @@ class ClaudeSessionManager:
         session_id = None
 
         if continue_session:
-            session_id = self._get_session_id_from_db(device_id, room_id, thread_id)
+            session_id = await asyncio.to_thread(self._get_session_id_from_db, device_id, room_id, thread_id)
 
         if session_id:
             cmd.extend(["--resume", session_id])
@@ -108,15 +404,8 @@ class ClaudeSessionManager:
         work_dir = Path(workspace_path) if workspace_path else self.trusted_directory
 
         try:
-            result = subprocess.run(
-                cmd,
-                input=prompt,
-                capture_output=True,
-                text=True,
-                timeout=1800,  # 30 minutes (extended from 5 min for long Codex jobs)
-                cwd=work_dir,
-            )
-        except subprocess.TimeoutExpired:
+            returncode, stdout, stderr = await self._run_cli(cmd, prompt, work_dir, on_output)
+        except asyncio.TimeoutError:
             LOGGER.error("Claude session timed out for %s", device_id)
             return {"success": False, "output": "", "session_id": None, "error": "Timeout"}
         except Exception as exc:  # pylint: disable=broad-except
@@ -128,59 +417,23 @@ class ClaudeSessionManager:
                 "error": str(exc),
             }
 
-        if result.returncode == 0:
-            self._save_session_id_to_db(device_id, room_id, thread_id, session_id)
+        if returncode == 0:
+            self._save_session_id(device_id, room_id, thread_id, session_id)
 
         return {
-            "success": result.returncode == 0,
-            "output": result.stdout,
+            "success": returncode == 0,
+            "output": stdout,
             "session_id": session_id,
-            "error": result.stderr,
+            "error": stderr,
         }
 
 
-class CodexSessionManager:
+class CodexSessionManager(_BaseSessionManager):
     """Manage codex exec sessions with DB-backed persistence."""
 
-    def _get_session_id_from_db(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="codex", thread_id=thread_id)
-                .first()
-            )
-            return record.session_id if record else None
-        finally:
-            db.close()
+    RUNNER = "codex"
 
-    def _save_session_id_to_db(self, device_id: str, room_id: str, thread_id: str, session_id: str) -> None:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="codex", thread_id=thread_id)
-                .first()
-            )
-            if record:
-                record.session_id = session_id
-            else:
-                record = DeviceSession(
-                    device_id=device_id,
-                    room_id=room_id,
-                    runner="codex",
-                    thread_id=thread_id,
-                    session_id=session_id,
-                )
-                db.add(record)
-            db.commit()
-        finally:
-            db.close()
-
-    def get_session_id(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
-        return self._get_session_id_from_db(device_id, room_id, thread_id)
-
-    def execute_job(
+    async def execute_job(
         self,
         prompt: str,
         device_id: str,
@@ -189,6 +442,7 @@ class CodexSessionManager:
         continue_session: bool = True,
         settings: Optional[dict] = None,
         thread_id: Optional[str] = None,
+        on_output: Optional[OutputCallback] = None,
     ) -> Dict[str, Optional[str]]:
         if not thread_id:
             raise ValueError("thread_id is required for session management")
@@ -197,7 +451,7 @@ class CodexSessionManager:
         session_id = None
 
         if continue_session:
-            session_id = self._get_session_id_from_db(device_id, room_id, thread_id)
+            session_id = await asyncio.to_thread(self._get_session_id_from_db, device_id, room_id, thread_id)
             if session_id:
                 cmd.extend(["resume", session_id])
                 LOGGER.info(
@@ -208,81 +462,46 @@ class CodexSessionManager:
                     thread_id,
                 )
 
-        # Use workspace_path if provided (Codex doesn't use cwd in subprocess.run)
-        # But we'll keep the parameter for consistency with ClaudeSessionManager
+        extracted = None
+
+        async def _watch_output(stream: str, line: str) -> None:
+            # セッションIDは出力の先頭付近に1度だけ出るので、行単位で見つけ次第探索をやめる
+            nonlocal extracted
+            if extracted is None:
+                match = CODEx_SESSION_PATTERN.search(line)
+                if match:
+                    extracted = match.group(1)
+            if on_output is not None:
+                await on_output(stream, line)
+
         try:
-            result = subprocess.run(
-                cmd,
-                input=prompt,
-                capture_output=True,
-                text=True,
-                timeout=1800,  # 30 minutes (extended from 5 min for long Codex jobs)
-                cwd=Path(workspace_path) if workspace_path else None,
+            returncode, stdout, stderr = await self._run_cli(
+                cmd, prompt, Path(workspace_path) if workspace_path else None, _watch_output
             )
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             LOGGER.error("Codex session timed out for %s", device_id)
             return {"success": False, "output": "", "session_id": None, "error": "Timeout"}
         except Exception as exc:  # pylint: disable=broad-except
             LOGGER.exception("Codex execution failed: %s", exc)
             return {"success": False, "output": "", "session_id": None, "error": str(exc)}
 
-        extracted = None
-        combined_output = f"{result.stdout}\n{result.stderr}" if result.stderr else result.stdout
-        match = CODEx_SESSION_PATTERN.search(combined_output)
-        if result.returncode == 0 and match:
-            extracted = match.group(1)
-            self._save_session_id_to_db(device_id, room_id, thread_id, extracted)
+        if returncode == 0 and extracted:
+            self._save_session_id(device_id, room_id, thread_id, extracted)
 
         return {
-            "success": result.returncode == 0,
-            "output": result.stdout,
+            "success": returncode == 0,
+            "output": stdout,
             "session_id": extracted or session_id,
-            "error": result.stderr,
+            "error": stderr,
         }
 
 
-class GeminiSessionManager:
+class GeminiSessionManager(_BaseSessionManager):
     """Manage Gemini CLI sessions with DB-backed persistence."""
 
-    def _get_session_id_from_db(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="gemini", thread_id=thread_id)
-                .first()
-            )
-            return record.session_id if record else None
-        finally:
-            db.close()
+    RUNNER = "gemini"
 
-    def _save_session_id_to_db(self, device_id: str, room_id: str, thread_id: str, session_id: str) -> None:
-        db = SessionLocal()
-        try:
-            record = (
-                db.query(DeviceSession)
-                .filter_by(device_id=device_id, room_id=room_id, runner="gemini", thread_id=thread_id)
-                .first()
-            )
-            if record:
-                record.session_id = session_id
-            else:
-                record = DeviceSession(
-                    device_id=device_id,
-                    room_id=room_id,
-                    runner="gemini",
-                    thread_id=thread_id,
-                    session_id=session_id,
-                )
-                db.add(record)
-            db.commit()
-        finally:
-            db.close()
-
-    def get_session_id(self, device_id: str, room_id: str, thread_id: str) -> Optional[str]:
-        return self._get_session_id_from_db(device_id, room_id, thread_id)
-
-    def execute_job(
+    async def execute_job(
         self,
         prompt: str,
         device_id: str,
@@ -291,6 +510,7 @@ class GeminiSessionManager:
         continue_session: bool = True,
         settings: Optional[dict] = None,
         thread_id: Optional[str] = None,
+        on_output: Optional[OutputCallback] = None,
     ) -> Dict[str, Optional[str]]:
         if not thread_id:
             raise ValueError("thread_id is required for session management")
@@ -299,7 +519,7 @@ class GeminiSessionManager:
         session_id = None
 
         if continue_session:
-            session_id = self._get_session_id_from_db(device_id, room_id, thread_id)
+            session_id = await asyncio.to_thread(self._get_session_id_from_db, device_id, room_id, thread_id)
             if session_id:
                 cmd.extend(["--resume", session_id])
                 LOGGER.info(
@@ -321,14 +541,10 @@ class GeminiSessionManager:
         cmd.append(prompt)
 
         try:
-            result = subprocess.run(
-                cmd,
-                capture_output=True,
-                text=True,
-                timeout=1800,  # 30 minutes
-                cwd=Path(workspace_path) if workspace_path else None,
+            returncode, stdout, stderr = await self._run_cli(
+                cmd, None, Path(workspace_path) if workspace_path else None, on_output
             )
-        except subprocess.TimeoutExpired:
+        except asyncio.TimeoutError:
             LOGGER.error("Gemini session timed out for %s", device_id)
             return {"success": False, "output": "", "session_id": None, "error": "Timeout"}
         except Exception as exc:  # pylint: disable=broad-except
@@ -337,15 +553,15 @@ class GeminiSessionManager:
 
         # Gemini doesn't return session ID in output like Codex
         # For now, generate a UUID if successful and no existing session
-        if result.returncode == 0 and not session_id:
+        if returncode == 0 and not session_id:
             session_id = str(uuid.uuid4())
-            self._save_session_id_to_db(device_id, room_id, thread_id, session_id)
+            self._save_session_id(device_id, room_id, thread_id, session_id)
 
         return {
-            "success": result.returncode == 0,
-            "output": result.stdout,
+            "success": returncode == 0,
+            "output": stdout,
             "session_id": session_id,
-            "error": result.stderr,
+            "error": stderr,
         }
 
 
@@ -353,11 +569,23 @@ class SessionManager:
     """Facade that delegates to Claude, Codex, or Gemini session managers."""
 
     def __init__(self) -> None:
-        self.claude_manager = ClaudeSessionManager()
-        self.codex_manager = CodexSessionManager()
-        self.gemini_manager = GeminiSessionManager()
+        # 全runnerで書き込みタスクを1つ共有する
+        self.session_writer = _SessionIdWriter()
+        self.claude_manager = ClaudeSessionManager(session_writer=self.session_writer)
+        self.codex_manager = CodexSessionManager(self.session_writer)
+        self.gemini_manager = GeminiSessionManager(self.session_writer)
+        self._managers: Dict[str, _BaseSessionManager] = {
+            manager.RUNNER: manager
+            for manager in (self.claude_manager, self.codex_manager, self.gemini_manager)
+        }
+
+    def _manager_for(self, runner: str) -> _BaseSessionManager:
+        manager = self._managers.get(runner)
+        if manager is None:
+            raise ValueError(f"Unknown runner: {runner}")
+        return manager
 
-    def execute_job(
+    async def execute_job(
         self,
         runner: str,
         prompt: str,
@@ -367,29 +595,30 @@ class SessionManager:
         continue_session: bool = True,
         settings: Optional[dict] = None,
         thread_id: Optional[str] = None,
+        on_output: Optional[OutputCallback] = None,
     ) -> Dict[str, Optional[str]]:
-        if runner == "claude":
-            return self.claude_manager.execute_job(
-                prompt, device_id, room_id, workspace_path, continue_session, settings, thread_id
-            )
-        if runner == "codex":
-            return self.codex_manager.execute_job(
-                prompt, device_id, room_id, workspace_path, continue_session, settings, thread_id
-            )
-        if runner == "gemini":
-            return self.gemini_manager.execute_job(
-                prompt, device_id, room_id, workspace_path, continue_session, settings, thread_id
-            )
-        raise ValueError(f"Unknown runner: {runner}")
+        return await self._manager_for(runner).execute_job(
+            prompt, device_id, room_id, workspace_path, continue_session, settings, thread_id, on_output
+        )
 
     def get_session_status(self, runner: str, device_id: str, room_id: str, thread_id: str) -> Dict[str, Optional[str]]:
-        if runner == "claude":
-            session_id = self.claude_manager.get_session_id(device_id, room_id, thread_id)
-        elif runner == "codex":
-            session_id = self.codex_manager.get_session_id(device_id, room_id, thread_id)
-        elif runner == "gemini":
-            session_id = self.gemini_manager.get_session_id(device_id, room_id, thread_id)
-        else:
-            raise ValueError(f"Unknown runner: {runner}")
-
+        session_id = self._manager_for(runner).get_session_id(device_id, room_id, thread_id)
         return {"exists": session_id is not None, "session_id": session_id}
+
+    async def aclose(self) -> None:
+        """Flush pending session-ID writes."""
+        await self.session_writer.aclose()
+
+    def discard_pending_session_writes(
+        self, device_id: str, room_id: str, runner: Optional[str] = None, thread_id: Optional[str] = None
+    ) -> None:
+        """Drop queued session-ID writes; call before deleting DeviceSession rows."""
+        self.session_writer.discard(device_id, room_id, runner, thread_id)
+
+    def invalidate_session_cache(
+        self, runner: str, device_id: str, room_id: str, thread_id: Optional[str] = None
+    ) -> None:
+        """Forget cached session IDs after DeviceSession rows are deleted outside the managers."""
+        manager = self._managers.get(runner)
+        if manager is not None:
+            manager.session_cache.invalidate(device_id, room_id, thread_id)
@@ -4,75 +4,167 @@ from __future__ import annotations
 import asyncio
 import json
 import logging
-from time import time
-from typing import AsyncGenerator, Dict, Optional, Set
+from collections import OrderedDict
+from time import monotonic
+from typing import AsyncGenerator, Dict, List, NamedTuple, Optional, Set, Tuple, Union
+
+try:
+    import orjson
+
+    def _encode(obj: dict) -> bytes:
+        return orjson.dumps(obj)
+except ImportError:  # pragma: no cover - optional speedup
+    def _encode(obj: dict) -> bytes:
+        return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
 
 LOGGER = logging.getLogger(__name__)
 
+# 購読者ごとのキュー上限。遅いクライアントは古いものから捨てて追いつかせる
+SSE_QUEUE_MAXSIZE = 256
+
+# broadcast_event のレート制限で覚えておくイベント名の上限（古いものから忘れる）
+EVENT_RATE_LIMIT_MAXSIZE = 1024
+
+
+def _data_frame(payload: dict) -> bytes:
+    """Build an SSE data frame; done once per broadcast, not once per subscriber."""
+    return b"data: " + _encode(payload) + b"\n\n"
+
+
+class _StatusUpdate(NamedTuple):
+    """A job status payload with its pre-built frame (None once merged)."""
+
+    payload: dict
+    frame: Optional[bytes]
+
+
+# Queue items: a status update, a pre-serialized frame (output chunks, named events), or None to close
+QueueItem = Union[_StatusUpdate, bytes, None]
+
+
+def _is_status_payload(item: QueueItem) -> bool:
+    """True for job status updates (not named events, output chunks or the close sentinel)."""
+    return isinstance(item, _StatusUpdate)
+
+
+def _put_dropping_oldest(queue: asyncio.Queue, item: QueueItem) -> bool:
+    """Enqueue without blocking, evicting the oldest item if the queue is full.
+
+    Returns True when something was dropped.
+    """
+    try:
+        queue.put_nowait(item)
+        return False
+    except asyncio.QueueFull:
+        try:
+            queue.get_nowait()
+        except asyncio.QueueEmpty:  # pragma: no cover - consumer drained it meanwhile
+            pass
+        queue.put_nowait(item)
+        return True
+
+
+def _coalesce_status_payloads(items: List[QueueItem]) -> List[QueueItem]:
+    """Merge runs of consecutive job status payloads into one.
+
+    Later keys win, so e.g. a queued "running" update followed by the final
+    "success" update collapses into one payload carrying started_at,
+    finished_at and exit_code. Named events, output chunks and the None close
+    sentinel are kept as-is and act as boundaries.
+    """
+    merged: List[QueueItem] = []
+    for item in items:
+        if _is_status_payload(item) and merged and _is_status_payload(merged[-1]):
+            merged[-1] = _StatusUpdate({**merged[-1].payload, **item.payload}, None)
+        else:
+            merged.append(item)
+    return merged
+
 
 class SSEManager:
     """Tracks active SSE subscriptions and broadcasts job status updates."""
 
     def __init__(self) -> None:
-        self._connections: Dict[str, Set[asyncio.Queue]] = {}
-        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        # Immutable per-job snapshots, replaced on subscribe/unsubscribe, so
+        # broadcast can iterate them across awaits without copying
+        self._connections: Dict[str, Tuple[asyncio.Queue, ...]] = {}
         # Global event subscribers (for certificate events, etc.)
         self._global_subscribers: Set[asyncio.Queue] = set()
-        # Rate limiting for broadcast events (event_name -> last_broadcast_time)
-        self._event_rate_limits: Dict[str, float] = {}
-
-    @property
-    def loop(self) -> Optional[asyncio.AbstractEventLoop]:
-        return self._loop
+        # Rate limiting for broadcast events (event_name -> last monotonic broadcast time), LRU-bounded
+        self._event_rate_limits: "OrderedDict[str, float]" = OrderedDict()
 
-    async def subscribe(self, job_id: str) -> AsyncGenerator[str, None]:
+    async def subscribe(self, job_id: str) -> AsyncGenerator[Union[str, bytes], None]:
         """Register an SSE subscriber for the specified job."""
-        current_loop = asyncio.get_running_loop()
-        if self._loop is None or self._loop.is_closed():
-            self._loop = current_loop
-        queue: asyncio.Queue = asyncio.Queue()
-        self._connections.setdefault(job_id, set()).add(queue)
+        queue: asyncio.Queue = asyncio.Queue(maxsize=SSE_QUEUE_MAXSIZE)
+        self._connections[job_id] = self._connections.get(job_id, ()) + (queue,)
         LOGGER.info("SSE connection opened for job %s (subscribers=%d)", job_id, len(self._connections[job_id]))
 
         HEARTBEAT_INTERVAL = 30.0
 
         try:
-            while True:
+            closing = False
+            while not closing:
                 try:
                     payload = await asyncio.wait_for(queue.get(), timeout=HEARTBEAT_INTERVAL)
-                    if payload is None:
-                        LOGGER.info("[SSE-CLOSE] job_id=%s, received None, closing stream", job_id)
-                        break
-                    LOGGER.debug("[SSE-SEND] job_id=%s, payload_keys=%s", job_id, list(payload.keys()))
-                    yield f"data: {json.dumps(payload)}\n\n"
                 except asyncio.TimeoutError:
                     LOGGER.debug("[SSE-HEARTBEAT] job_id=%s", job_id)
                     yield ":heartbeat\n\n"
+                    continue
+
+                # Client fell behind: drain the backlog and merge consecutive
+                # status updates so only the latest state is sent.
+                batch = [payload]
+                while not queue.empty():
+                    batch.append(queue.get_nowait())
+
+                for item in _coalesce_status_payloads(batch):
+                    if item is None:
+                        LOGGER.info("[SSE-CLOSE] job_id=%s, received None, closing stream", job_id)
+                        closing = True
+                        break
+                    if isinstance(item, bytes):
+                        # broadcast 側で一度だけ整形済みのフレーム
+                        yield item
+                        continue
+                    LOGGER.debug("[SSE-SEND] job_id=%s, payload_keys=%s", job_id, list(item.payload.keys()))
+                    # 統合されたステータスだけは整形し直す
+                    yield item.frame if item.frame is not None else _data_frame(item.payload)
         finally:
-            if job_id in self._connections:
-                self._connections[job_id].discard(queue)
-                if not self._connections[job_id]:
-                    del self._connections[job_id]
+            remaining = tuple(q for q in self._connections.get(job_id, ()) if q is not queue)
+            if remaining:
+                self._connections[job_id] = remaining
+            else:
+                self._connections.pop(job_id, None)
             LOGGER.info(
                 "SSE connection closed for job %s (remaining_subscribers=%d)",
                 job_id,
                 len(self._connections.get(job_id, [])),
             )
 
+    def subscribers(self, job_id: str) -> int:
+        """Return the number of active SSE subscribers for a job."""
+        connections = self._connections.get(job_id)
+        return len(connections) if connections else 0
+
     async def broadcast(self, job_id: str, payload: dict) -> None:
         """Send a payload to all subscribers of the specified job."""
         connections = self._connections.get(job_id)
         if not connections:
             return
         LOGGER.debug("Broadcasting SSE event to %d subscribers for job %s", len(connections), job_id)
-        for queue in list(connections):
-            await queue.put(payload)
+        frame = _data_frame(payload)
+        # ステータス更新は購読側で統合できるよう payload も持たせる
+        message: QueueItem = frame if "chunk" in payload or "event" in payload else _StatusUpdate(payload, frame)
+        dropped = sum(_put_dropping_oldest(queue, message) for queue in connections)
+        if dropped:
+            LOGGER.warning("SSE backlog full for %d subscriber(s) of job %s, dropped oldest event", dropped, job_id)
 
     async def close(self, job_id: str) -> None:
         """Gracefully close all SSE connections for a job."""
-        connections = self._connections.pop(job_id, set())
+        connections = self._connections.pop(job_id, ())
         for queue in connections:
-            await queue.put(None)
+            # 終了通知は必ず届ける（満杯なら最古を捨てる。None 自体は捨てられない）
+            _put_dropping_oldest(queue, None)
 
     async def broadcast_event(
         self,
@@ -92,16 +184,18 @@ class SSEManager:
         Returns:
             Number of connections that received the event
 
-        Note: The payload is wrapped with an 'event' field for proper SSE formatting.
-        Global subscribers (/events endpoint) format it as:
+        Note: Frames are serialized here once. Job subscribers receive the
+        payload wrapped with an 'event' field; global subscribers (/events
+        endpoint) receive:
             event: {event_name}
             data: {json payload}
         """
-        now = time()
+        # monotonic: NTP などで壁時計が戻ってもレート制限が狂わない
+        now = monotonic()
 
         # Check rate limit
-        last_broadcast = self._event_rate_limits.get(event_name, 0)
-        if now - last_broadcast < rate_limit_seconds:
+        last_broadcast = self._event_rate_limits.get(event_name)
+        if last_broadcast is not None and now - last_broadcast < rate_limit_seconds:
             LOGGER.warning(
                 "[SSE-RATE-LIMIT] Event %s rate limited, last broadcast %d seconds ago",
                 event_name,
@@ -110,30 +204,27 @@ class SSEManager:
             return 0
 
         self._event_rate_limits[event_name] = now
+        self._event_rate_limits.move_to_end(event_name)
+        if len(self._event_rate_limits) > EVENT_RATE_LIMIT_MAXSIZE:
+            self._event_rate_limits.popitem(last=False)
 
         # Wrap payload with event name for proper SSE handling
         wrapped_payload = {
             "event": event_name,
             "data": payload,
         }
-
-        # Broadcast to all job subscribers (for backwards compatibility)
-        sent_count = 0
-        for job_id, connections in self._connections.items():
-            for queue in list(connections):
-                try:
-                    await queue.put(wrapped_payload)
-                    sent_count += 1
-                except Exception as e:
-                    LOGGER.warning("Failed to send event to queue: %s", e)
-
-        # Broadcast to global subscribers (/events endpoint)
-        for queue in list(self._global_subscribers):
-            try:
-                await queue.put(wrapped_payload)
-                sent_count += 1
-            except Exception as e:
-                LOGGER.warning("Failed to send event to global subscriber: %s", e)
+        # Serialize once per event rather than once per subscriber
+        job_frame = _data_frame(wrapped_payload)
+        global_frame = b"event: " + event_name.encode("utf-8") + b"\n" + _data_frame(payload)
+
+        # Job subscribers (for backwards compatibility) + global subscribers (/events endpoint)
+        targets = [(queue, job_frame) for connections in self._connections.values() for queue in connections]
+        targets.extend((queue, global_frame) for queue in self._global_subscribers)
+
+        dropped = sum(_put_dropping_oldest(queue, frame) for queue, frame in targets)
+        if dropped:
+            LOGGER.warning("[SSE-BROADCAST] Backlog full for %d subscriber(s), dropped oldest event", dropped)
+        sent_count = len(targets)
 
         LOGGER.info(
             "[SSE-BROADCAST] Event %s sent to %d connections",
@@ -3,9 +3,14 @@ from __future__ import annotations
 
 from typing import Dict, List, Optional
 
+# 固定の先頭引数（呼び出しごとにリテラルのリストを組み立てない）
+_CLAUDE_PREFIX = ("claude", "--print", "--output-format", "text")
+_CODEX_PREFIX = ("codex", "exec")
+_GEMINI_PREFIX = ("gemini", "-o", "text")
+
 
 def build_claude_command(settings: Optional[Dict] = None) -> List[str]:
-    cmd: List[str] = ["claude", "--print", "--output-format", "text"]
+    cmd: List[str] = list(_CLAUDE_PREFIX)
 
     if settings and "claude" in settings:
         cfg = settings["claude"]
@@ -30,7 +35,7 @@ def build_claude_command(settings: Optional[Dict] = None) -> List[str]:
 
 
 def build_codex_command(settings: Optional[Dict] = None) -> List[str]:
-    cmd: List[str] = ["codex", "exec"]
+    cmd: List[str] = list(_CODEX_PREFIX)
 
     if settings and "codex" in settings:
         cfg = settings["codex"]
@@ -55,7 +60,7 @@ def build_codex_command(settings: Optional[Dict] = None) -> List[str]:
 
 def build_gemini_command(settings: Optional[Dict] = None) -> List[str]:
     """Build Gemini CLI command."""
-    cmd: List[str] = ["gemini", "-o", "text"]
+    cmd: List[str] = list(_GEMINI_PREFIX)
 
     if settings and "gemini" in settings:
         cfg = settings["gemini"]
@@ -1,6 +1,8 @@
 """Workspace path validation for security."""
+import time
+from functools import lru_cache
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional
 
 ALLOWED_BASE_PATHS: List[str] = [
     "/Users/macstudio/Projects",
@@ -19,6 +21,74 @@ FORBIDDEN_PATHS: List[str] = [
     "/var",
 ]
 
+_ALLOW = "allow"
+_DENY = "deny"
+
+
+class _PathTrieNode:
+    """One path component in the allowed/forbidden root trie."""
+
+    __slots__ = ("children", "verdict")
+
+    def __init__(self) -> None:
+        self.children: Dict[str, "_PathTrieNode"] = {}
+        self.verdict: Optional[str] = None
+
+
+def _build_root_trie(allowed: List[str], forbidden: List[str]) -> _PathTrieNode:
+    root = _PathTrieNode()
+    # 許可ディレクトリは解決済みのパスで登録する（シンボリックリンク経由の実体と比較するため）
+    entries = [(Path(p).resolve().parts, _ALLOW) for p in allowed]
+    entries += [(Path(p).parts, _DENY) for p in forbidden]
+    for parts, verdict in entries:
+        node = root
+        for part in parts:
+            node = node.children.setdefault(part, _PathTrieNode())
+        node.verdict = verdict
+    return root
+
+
+# 許可・禁止ルートをパス要素単位のトライにまとめ、1回の走査で両方を判定する。
+# 要素単位で比べるので /Users/macstudio/ProjectsEvil のような隣接ディレクトリは一致しない
+_ROOT_TRIE = _build_root_trie(ALLOWED_BASE_PATHS, FORBIDDEN_PATHS)
+
+
+def _is_allowed_path(abs_path: Path) -> bool:
+    """Walk the root trie along abs_path; any forbidden root on the way wins."""
+    node = _ROOT_TRIE
+    allowed = False
+    for part in abs_path.parts:
+        node = node.children.get(part)
+        if node is None:
+            break
+        if node.verdict == _DENY:
+            return False
+        if node.verdict == _ALLOW:
+            allowed = True
+    return allowed
+
+# resolve() の結果を保持する秒数（シンボリックリンクの付け替えがこの時間内に反映される）
+_RESOLVE_CACHE_SECONDS = 5
+
+
+@lru_cache(maxsize=256)
+def _cached_safe_resolve(path: str, time_bucket: int) -> Optional[str]:
+    try:
+        abs_path = Path(path).resolve()
+    except (ValueError, OSError):
+        return None
+
+    return str(abs_path) if _is_allowed_path(abs_path) else None
+
+
+def _resolve_if_safe(path: str) -> Optional[str]:
+    """Return the resolved path if it is safe, else None; cached for a few seconds.
+
+    Results are keyed on a monotonic time bucket so symlink changes are picked
+    up; clear _cached_safe_resolve if the allowed/forbidden lists change.
+    """
+    return _cached_safe_resolve(path, int(time.monotonic() // _RESOLVE_CACHE_SECONDS))
+
 
 def is_safe_workspace_path(path: str) -> bool:
     """
@@ -30,23 +100,7 @@ def is_safe_workspace_path(path: str) -> bool:
     Returns:
         True if the path is safe, False otherwise
     """
-    try:
-        abs_path = Path(path).resolve()
-        abs_path_str = str(abs_path)
-
-        # Check forbidden paths first
-        for forbidden in FORBIDDEN_PATHS:
-            if abs_path_str.startswith(forbidden):
-                return False
-
-        # Check if path is within allowed base paths
-        for allowed in ALLOWED_BASE_PATHS:
-            if abs_path_str.startswith(allowed):
-                return True
-
-        return False
-    except (ValueError, OSError):
-        return False
+    return _resolve_if_safe(path) is not None
 
 
 def validate_workspace_path(path: str) -> str:
@@ -62,6 +116,7 @@ def validate_workspace_path(path: str) -> str:
     Raises:
         ValueError: If the path is not allowed
     """
-    if not is_safe_workspace_path(path):
+    resolved = _resolve_if_safe(path)
+    if resolved is None:
         raise ValueError(f"Workspace path is not allowed: {path}")
-    return str(Path(path).resolve())
+    return resolved
@@ -2,12 +2,19 @@
 from __future__ import annotations
 
 import json
-from typing import Any, Dict, List, Optional
+import re
+from typing import Any, Callable, Dict, FrozenSet, List, Optional, Tuple, Union
+
+try:
+    from orjson import loads as _loads
+except ImportError:  # pragma: no cover - optional speedup
+    _loads = json.loads
 
 # Allowed values per implementation plan v1.6
-ALLOWED_VALUES: Dict[str, Dict[str, List[str]]] = {
+# 検証のたびに所属判定するので frozenset で持つ（O(1)）
+ALLOWED_VALUES: Dict[str, Dict[str, FrozenSet[str]]] = {
     "claude": {
-        "model": [
+        "model": frozenset({
             "default",
             "sonnet",
             "opus",
@@ -15,9 +22,9 @@ ALLOWED_VALUES: Dict[str, Dict[str, List[str]]] = {
             "claude-opus-4-5-20251101",
             "claude-sonnet-4-5-20250929",
             "claude-sonnet-4-20250514",
-        ],
-        "permission_mode": ["default", "ask", "deny"],
-        "tools": [
+        }),
+        "permission_mode": frozenset({"default", "ask", "deny"}),
+        "tools": frozenset({
             "Bash",
             "Edit",
             "Read",
@@ -31,28 +38,29 @@ ALLOWED_VALUES: Dict[str, Dict[str, List[str]]] = {
             "TodoWrite",
             "SlashCommand",
             "Skill",
-        ],
+        }),
     },
     "codex": {
-        "model": ["default", "gpt-5.2-codex", "gpt-5.1-codex-max", "gpt-5.1-codex-mini"],
-        "sandbox": ["read-only", "workspace-write", "danger-full-access"],
-        "approval_policy": ["untrusted", "on-failure", "on-request", "never"],
-        "reasoning_effort": ["low", "medium", "high", "extra-high"],
+        "model": frozenset({"default", "gpt-5.2-codex", "gpt-5.1-codex-max", "gpt-5.1-codex-mini"}),
+        "sandbox": frozenset({"read-only", "workspace-write", "danger-full-access"}),
+        "approval_policy": frozenset({"untrusted", "on-failure", "on-request", "never"}),
+        "reasoning_effort": frozenset({"low", "medium", "high", "extra-high"}),
     },
     "gemini": {
-        "model": ["default", "gemini-3.0-pro", "gemini-2.5-pro", "gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.0-flash"],
-        "approval_mode": ["default", "auto_edit", "yolo"],
+        "model": frozenset({"default", "gemini-3.0-pro", "gemini-2.5-pro", "gemini-2.5-flash", "gemini-2.5-flash-lite", "gemini-2.0-flash"}),
+        "approval_mode": frozenset({"default", "auto_edit", "yolo"}),
     },
 }
 
 # Reserved options that must not be passed via custom_flags
-RESERVED_FLAGS: Dict[str, List[str]] = {
-    "claude": ["--model", "--permission-mode", "--tools"],
-    "codex": ["-m", "--model", "-s", "--sandbox", "-a", "--ask-for-approval", "-r", "--reasoning-effort"],
-    "gemini": ["-m", "--model", "-s", "--sandbox", "-y", "--yolo", "--approval-mode"],
+RESERVED_FLAGS: Dict[str, FrozenSet[str]] = {
+    "claude": frozenset({"--model", "--permission-mode", "--tools"}),
+    "codex": frozenset({"-m", "--model", "-s", "--sandbox", "-a", "--ask-for-approval", "-r", "--reasoning-effort"}),
+    "gemini": frozenset({"-m", "--model", "-s", "--sandbox", "-y", "--yolo", "--approval-mode"}),
 }
 
-DANGEROUS_FLAGS = [
+# 部分一致で判定するので集合ではなくタプル
+DANGEROUS_FLAGS = (
     "--exec",
     "--eval",
     "--unsafe",
@@ -61,83 +69,124 @@ DANGEROUS_FLAGS = [
     "--no-verify",
     "--rm",
     "--delete",
-]
+)
 
-SHELL_META_CHARS = [";", "|", "&", "$", "`", "(", ")", "<", ">", "\n", "\r"]
+SHELL_META_CHARS = (";", "|", "&", "$", "`", "(", ")", "<", ">", "\n", "\r")
+# 危険フラグ（大文字小文字無視の部分一致）とシェルメタ文字を1回の走査で検出する
+_FORBIDDEN_FLAG_CONTENT = re.compile(
+    "(?P<dangerous>{})|(?P<meta>[{}])".format(
+        "|".join(map(re.escape, DANGEROUS_FLAGS)),
+        re.escape("".join(SHELL_META_CHARS)),
+    ),
+    re.IGNORECASE,
+)
 
+_NO_RESERVED_FLAGS: FrozenSet[str] = frozenset()
 
-class ValidationError(ValueError):
-    """Raised when settings validation fails."""
+# フラグ名 = 先頭から最初の "=" または空白の手前まで（中間リストを作らずに切り出す）
+_FLAG_NAME = re.compile(r"[^=\s]*")
 
 
-def _validate_flag_name(flag: str, reserved: List[str]) -> None:
-    flag_name = flag.split("=")[0].split()[0]
-    if flag_name in reserved:
-        raise ValidationError(
-            f"Reserved flag cannot be used in custom_flags: {flag_name}. Use dedicated fields instead."
-        )
+class ValidationError(ValueError):
+    """Raised when settings validation fails."""
 
 
 def validate_custom_flags(flags: List[str], ai_type: str) -> None:
     if len(flags) > 10:
         raise ValidationError("Too many custom flags (max 10)")
 
-    reserved = RESERVED_FLAGS.get(ai_type, [])
+    reserved = RESERVED_FLAGS.get(ai_type, _NO_RESERVED_FLAGS)
+    # ループ内で毎回属性を引かないよう束縛しておく
+    match_name = _FLAG_NAME.match
+    search_forbidden = _FORBIDDEN_FLAG_CONTENT.search
 
     for flag in flags:
-        if not flag.startswith("-"):
+        if not isinstance(flag, str) or not flag.startswith("-"):
             raise ValidationError(f"Invalid flag format: {flag}")
         if len(flag) > 100:
             raise ValidationError(f"Flag too long: {flag}")
-        _validate_flag_name(flag, reserved)
-        if any(d in flag.lower() for d in DANGEROUS_FLAGS):
-            raise ValidationError(f"Dangerous flag detected: {flag}")
-        if any(char in flag for char in SHELL_META_CHARS):
+        flag_name = match_name(flag).group()
+        if flag_name in reserved:
+            raise ValidationError(
+                f"Reserved flag cannot be used in custom_flags: {flag_name}. Use dedicated fields instead."
+            )
+        match = search_forbidden(flag)
+        if match is not None:
+            if match.lastgroup == "dangerous":
+                raise ValidationError(f"Dangerous flag detected: {flag}")
             raise ValidationError(f"Invalid character in flag: {flag}")
 
 
-def _validate_section(section: Dict[str, Any], ai_type: str) -> Dict[str, Any]:
-    allowed = ALLOWED_VALUES[ai_type]
-    result: Dict[str, Any] = {}
+def _is_allowed(value: Any, allowed: FrozenSet[str]) -> bool:
+    # frozenset への in はハッシュ不可な値（JSON の配列・オブジェクト）で TypeError になる
+    return isinstance(value, str) and value in allowed
 
-    # model
-    if "model" in section:
-        model = section["model"]
-        if model not in allowed["model"]:
-            raise ValidationError(f"Invalid model for {ai_type}: {model}")
-        result["model"] = model
 
-    # permission_mode / sandbox / approval_policy / reasoning_effort
-    for key in ("permission_mode", "sandbox", "approval_policy", "reasoning_effort"):
-        if key in section:
-            value = section[key]
-            if key not in allowed:
-                raise ValidationError(f"Unsupported field for {ai_type}: {key}")
-            if value not in allowed[key]:
-                raise ValidationError(f"Invalid {key} for {ai_type}: {value}")
-            result[key] = value
-
-    # tools
-    if "tools" in section:
-        tools = section["tools"]
-        if not isinstance(tools, list):
-            raise ValidationError("tools must be a list")
-        for tool in tools:
-            if tool not in allowed["tools"]:
-                raise ValidationError(f"Invalid tool for {ai_type}: {tool}")
-        result["tools"] = tools
+_ENUM_FIELDS = ("permission_mode", "sandbox", "approval_policy", "reasoning_effort")
 
-    # custom_flags
-    if "custom_flags" in section:
-        flags = section["custom_flags"]
-        if not isinstance(flags, list):
-            raise ValidationError("custom_flags must be a list")
-        validate_custom_flags(flags, ai_type)
-        result["custom_flags"] = flags
 
-    # v4.6: allowed_tools / disallowed_tools (claude only, free-form patterns)
-    if ai_type == "claude":
-        for key in ("allowed_tools", "disallowed_tools"):
+def _make_section_validator(ai_type: str) -> Callable[[Dict[str, Any]], Dict[str, Any]]:
+    """Build the claude/codex section validator with its schema bound once.
+
+    The allowed sets are looked up here, at import, instead of on every call.
+    """
+    allowed = ALLOWED_VALUES[ai_type]
+    models = allowed["model"]
+    tools_allowed = allowed.get("tools")
+    enum_fields = tuple((key, allowed[key]) for key in _ENUM_FIELDS if key in allowed)
+    unsupported_fields = tuple(key for key in _ENUM_FIELDS if key not in allowed)
+    pattern_fields = ("allowed_tools", "disallowed_tools") if ai_type == "claude" else ()
+
+    def validate(section: Dict[str, Any]) -> Dict[str, Any]:
+        if not section:
+            return {}
+        result: Dict[str, Any] = {}
+
+        # model
+        if "model" in section:
+            model = section["model"]
+            if not _is_allowed(model, models):
+                raise ValidationError(f"Invalid model for {ai_type}: {model}")
+            result["model"] = model
+
+        # permission_mode / sandbox / approval_policy / reasoning_effort
+        for key in unsupported_fields:
+            if key in section:
+                raise ValidationError(f"Unsupported field for {ai_type}: {key}")
+        for key, values in enum_fields:
+            if key in section:
+                value = section[key]
+                if not _is_allowed(value, values):
+                    raise ValidationError(f"Invalid {key} for {ai_type}: {value}")
+                result[key] = value
+
+        # tools
+        if "tools" in section:
+            if tools_allowed is None:
+                raise ValidationError(f"Unsupported field for {ai_type}: tools")
+            tools = section["tools"]
+            if not isinstance(tools, list):
+                raise ValidationError("tools must be a list")
+            # 要素ごとのループではなく集合差を1回で求める
+            try:
+                invalid = set(tools).difference(tools_allowed)
+            except TypeError as exc:  # ハッシュ不可な要素（dict など）が混じっている
+                raise ValidationError(f"Invalid tool for {ai_type}: tools must be strings") from exc
+            if invalid:
+                names = ", ".join(sorted(map(str, invalid)))
+                raise ValidationError(f"Invalid tool for {ai_type}: {names}")
+            result["tools"] = tools
+
+        # custom_flags
+        if "custom_flags" in section:
+            flags = section["custom_flags"]
+            if not isinstance(flags, list):
+                raise ValidationError("custom_flags must be a list")
+            validate_custom_flags(flags, ai_type)
+            result["custom_flags"] = flags
+
+        # v4.6: allowed_tools / disallowed_tools (claude only, free-form patterns)
+        for key in pattern_fields:
             if key in section:
                 value = section[key]
                 if not isinstance(value, list):
@@ -150,25 +199,34 @@ def _validate_section(section: Dict[str, Any], ai_type: str) -> Dict[str, Any]:
                         raise ValidationError(f"Pattern too long in {key}: {pattern[:20]}...")
                 result[key] = value
 
-    return result
+        return result
+
+    validate.__name__ = validate.__qualname__ = f"_validate_{ai_type}_section"
+    return validate
+
+
+_validate_claude_section = _make_section_validator("claude")
+_validate_codex_section = _make_section_validator("codex")
 
 
 def _validate_gemini_section(section: Dict[str, Any]) -> Dict[str, Any]:
     """Validate gemini-specific settings."""
+    if not section:
+        return {}
     allowed = ALLOWED_VALUES["gemini"]
     result: Dict[str, Any] = {}
 
     # model
     if "model" in section:
         model = section["model"]
-        if model not in allowed["model"]:
+        if not _is_allowed(model, allowed["model"]):
             raise ValidationError(f"Invalid model for gemini: {model}")
         result["model"] = model
 
     # approval_mode
     if "approval_mode" in section:
         value = section["approval_mode"]
-        if value not in allowed["approval_mode"]:
+        if not _is_allowed(value, allowed["approval_mode"]):
             raise ValidationError(f"Invalid approval_mode for gemini: {value}")
         result["approval_mode"] = value
 
@@ -197,6 +255,17 @@ def _validate_gemini_section(section: Dict[str, Any]) -> Dict[str, Any]:
     return result
 
 
+_MISSING = object()
+
+# top-level key -> section validator (other keys are ignored)
+_SECTION_VALIDATORS: Tuple[Tuple[str, Callable[[Dict[str, Any]], Dict[str, Any]]], ...] = (
+    ("claude", _validate_claude_section),
+    ("codex", _validate_codex_section),
+    ("gemini", _validate_gemini_section),
+)
+_SECTION_KEYS = frozenset(key for key, _ in _SECTION_VALIDATORS)
+
+
 def validate_settings(settings: Optional[Dict[str, Any]]) -> Optional[Dict[str, Any]]:
     """Validate and sanitize settings structure.
 
@@ -208,36 +277,35 @@ def validate_settings(settings: Optional[Dict[str, Any]]) -> Optional[Dict[str,
         return None
     if not isinstance(settings, dict):
         raise ValidationError("Settings must be an object")
+    # 空、または既知のセクションが1つも無ければ何も検証せずに返す
+    if settings.keys().isdisjoint(_SECTION_KEYS):
+        return {}
 
     sanitized: Dict[str, Any] = {}
 
-    if "claude" in settings:
-        if not isinstance(settings["claude"], dict):
-            raise ValidationError("claude settings must be an object")
-        sanitized["claude"] = _validate_section(settings["claude"], "claude")
-
-    if "codex" in settings:
-        if not isinstance(settings["codex"], dict):
-            raise ValidationError("codex settings must be an object")
-        sanitized["codex"] = _validate_section(settings["codex"], "codex")
-
-    if "gemini" in settings:
-        if not isinstance(settings["gemini"], dict):
-            raise ValidationError("gemini settings must be an object")
-        sanitized["gemini"] = _validate_gemini_section(settings["gemini"])
+    # 各セクションは1回の get で取り出す（"in" と [] の二重参照をしない）
+    for key, validate in _SECTION_VALIDATORS:
+        section = settings.get(key, _MISSING)
+        if section is _MISSING:
+            continue
+        if not isinstance(section, dict):
+            raise ValidationError(f"{key} settings must be an object")
+        sanitized[key] = validate(section)
 
     # ignore unknown top-level keys (whitelist policy)
     return sanitized
 
 
-def parse_settings_json(raw: str) -> Optional[Dict[str, Any]]:
-    """Parse JSON string to dict or None.
+def parse_settings_json(raw: Union[str, bytes]) -> Optional[Dict[str, Any]]:
+    """Parse JSON string (or UTF-8 bytes, e.g. a request body) to dict or None.
 
     Raises ValidationError on JSON decode errors.
     """
 
     try:
-        parsed = json.loads(raw)
-    except json.JSONDecodeError as exc:
+        parsed = _loads(raw)
+    except json.JSONDecodeError as exc:  # orjson.JSONDecodeError もこのサブクラス
         raise ValidationError(f"Invalid JSON: {exc.msg}") from exc
+    except UnicodeDecodeError as exc:
+        raise ValidationError("Settings JSON must be UTF-8") from exc
     return parsed if parsed is not None else None